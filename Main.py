@@ -1,172 +1,73 @@
 
 import streamlit as st
-import pandas as pd
-import csv
-import os
 import datetime
-import random
+import functools
+from body_metrics import calculate_metrics
+from meal_engines import ENGINES, GREEDY_ENGINE
+from plan_export import EXPORT_FORMATS, MEDIA_TYPES, export_chunks, plan_days
+from plan_view import display_day_table, select_plan_day
+from session_memo import memoize, plan_round
+from timings import timed
 
+# The catalog, the planner and the plan store pull in pandas and NumPy; they are imported where the meals are
+# generated or shown, so the metrics draw without them
 
 
-# Define the file path for storing patient data
-DATA_FILE = "patient_data.csv"
 
-# Function to save patient data
-def save_patient_data(patient_data):
-    fieldnames = patient_data.keys()
-    file_exists = os.path.exists(DATA_FILE)
-    with open(DATA_FILE, mode='a', newline='') as file:
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        if not file_exists:
-            writer.writeheader()
-        # Add current date and time to the patient data
-        patient_data["datetime"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current date and time
-        writer.writerow(patient_data)
 
 
+# Warnings shown when the day total of a nutrient is out of the specified range
+NUTRIENT_WARNINGS = {
+    "Protein (g)": "Total protein intake is out of the specified range!",
+    "Carbohydrates (g)": "Total carbohydrate intake is out of the specified range!",
+    "Fat (g)": "Total fat intake is out of the specified range!"
+}
 
+# Names of the days of a week plan
+DAY_NAMES = ["اليوم الأول", "اليوم الثاني", "اليوم الثالث", "اليوم الرابع", "اليوم الخامس", "اليوم السادس", "اليوم السابع"]
 
-def calculate_bmi(weight, height):
-  return weight / ((height / 100)**2)
 
-# Function to calculate sum of numbers
-def calculate_sum(numbers):
-    return sum(numbers)
+# Function to generate the meal plans of some days for a patient. The seed comes from the patient name, the date
+# and the plan round of the session, so a rerun with the same inputs gets the same plans from the plan cache.
+# With more than one candidate, the best of that many seeded plans is kept (see plan_search).
+# Returns the plan ID and the plans.
+def generate_session_plans(patient_name, calorie_intake, days, protein_range=None, carb_range=None, fat_range=None, engine=GREEDY_ENGINE, variety_days=0, exclude=None, candidates=1):
+    from plan_cache import derive_seed, generate_plan
+    from plan_search import search_best_plan
+
+    seed = derive_seed(patient_name, datetime.date.today().isoformat(), plan_round())
+    if candidates > 1:
+        plan_request = {
+            "calorie_intake": calorie_intake, "days": days, "protein_range": protein_range, "carb_range": carb_range,
+            "fat_range": fat_range, "engine": engine, "variety_days": variety_days, "seed": seed, "exclude": exclude,
+        }
+        plan_id, meal_plans, score = search_best_plan(plan_request, candidates)
+        return plan_id, meal_plans
+    return generate_plan(calorie_intake, days, protein_range, carb_range, fat_range, engine, variety_days, seed, exclude=exclude)
+
+
+def generate_meal_plan(patient_name, calorie_intake, protein_range=None, carb_range=None, fat_range=None, engine=GREEDY_ENGINE, exclude=None, candidates=1):
+    plan_id, meal_plans = generate_session_plans(patient_name, calorie_intake, 1, protein_range, carb_range, fat_range, engine, exclude=exclude, candidates=candidates)
+    show_nutrient_warnings(meal_plans[0], protein_range, carb_range, fat_range)
+    return plan_id, meal_plans[0]
+
+
+# Function to check if the total nutrient intake is within the specified ranges
+def show_nutrient_warnings(meal_plan, protein_range=None, carb_range=None, fat_range=None):
+    from meal_planner import out_of_range_nutrients
+
+    for nutrient in out_of_range_nutrients(meal_plan, protein_range, carb_range, fat_range):
+        st.warning(NUTRIENT_WARNINGS[nutrient])
 
 
-def calculate_ideal_weight(height, gender):
-  if gender == "Male":
-    return 50 + 0.91 * (height - 152.4)
-  elif gender == "Female":
-    return 45.5 + 0.91 * (height - 152.4)
-  else:
-    return None
-
-
-def calculate_ideal_body_weight(height, gender):
-  if gender == "Male":
-    return 50 + 0.91 * (height - 152.4)
-  elif gender == "Female":
-    return 45.5 + 0.91 * (height - 152.4)
-  else:
-    return None
-
-
-def calculate_body_fat_percentage(weight, body_fat_mass):
-  return (body_fat_mass / weight) * 100
-
-
-def calculate_bmr(weight, height, age, gender):
-  if gender == "Male":
-    return 10 * weight + 6.25 * height - 5 * age + 5
-  elif gender == "Female":
-    return 10 * weight + 6.25 * height - 5 * age - 161
-  else:
-    return None
-
-
-def calculate_tdee(bmr, activity_level):
-  activity_factors = {
-      "Sedentary": 1.2,
-      "Lightly active": 1.375,
-      "Moderately active": 1.55,
-      "Very active": 1.725,
-      "Extra active": 1.9
-  }
-  return bmr * activity_factors[activity_level]
-
-
-def calculate_calorie_intake(tdee, goals, weight, ideal_weight):
-  if "Fitness" in goals:
-    if weight < ideal_weight:
-      goals.append("Weight gain")
-    elif weight > ideal_weight:
-      goals.append("Weight loss")
-  if "Weight loss" in goals:
-      return tdee - 500
-  elif "Rapid Weight Loss" in goals:
-      return tdee - 1000  # Subtract 1000 kcal/day for rapid weight loss
-  elif "Weight gain" in goals:
-    return tdee + 500
-  elif "Fitness" in goals:
-    return tdee  # No calorie adjustment for fitness goal, treat it as Ideal Weight
-  else:
-    return tdee
-
-
-def calculate_tbw(weight, height, age, gender):
-  if gender == "Male":
-    k = 2.447 - 0.09516 * age + 0.1074 * height + 0.3362 * weight
-  elif gender == "Female":
-    k = -2.097 + 0.1069 * height + 0.2466 * weight
-  else:
-    return None
-
-  return 0.3669 * k - 0.0906 * weight + 0.1074 * height + 0.2466 * weight
-
-
-
-def generate_meal_plan(calorie_intake, meals_df, protein_range=None, carb_range=None, fat_range=None):
-    meal_categories = {
-        "الفطار":0.20,
-        "الغداء": 0.40,
-        "العشاء": 0.30,
-        "السناكس": 0.10
-    }
-
-    meal_plans = {}
-    total_nutrients = {"Protein (g)": 0, "Carbohydrates (g)": 0, "Fat (g)": 0}
-
-    for meal_category, percentage in meal_categories.items():
-        calorie_allowance = calorie_intake * percentage
-        meal_plan = []
-        category_meals = meals_df[meals_df["Category"] == meal_category]
-
-        if protein_range:
-            category_meals = category_meals[(category_meals["Protein (g)"] >= protein_range[0]) & (category_meals["Protein (g)"] <= protein_range[1])]
-        if carb_range:
-            category_meals = category_meals[(category_meals["Carbohydrates (g)"] >= carb_range[0]) & (category_meals["Carbohydrates (g)"] <= carb_range[1])]
-        if fat_range:
-            category_meals = category_meals[(category_meals["Fat (g)"] >= fat_range[0]) & (category_meals["Fat (g)"] <= fat_range[1])]
-
-        category_meals = category_meals.sample(frac=1)
-
-        for index, row in category_meals.iterrows():
-            meal_name = row["Meal Name"]
-            meal_calories = row["Calories"]
-
-            if meal_calories <= calorie_allowance:
-                meal_plan.append({
-                    "Meal": meal_name,
-                    "Calories": meal_calories,
-                    "Ingredients": row["Ingredients"],
-                    "Weight (g)": row["Weight (g)"],
-                    "Protein (g)": row["Protein (g)"],
-                    "Carbohydrates (g)": row["Carbohydrates (g)"],
-                    "Fat (g)": row["Fat (g)"],
-                    "Category": row["Category"],
-                    "Meal Type" : row["Meal Type"]
-                })
-                calorie_allowance -= meal_calories
-
-                # Add the nutrients of the meal to the total nutrients
-                total_nutrients["Protein (g)"] += row["Protein (g)"]
-                total_nutrients["Carbohydrates (g)"] += row["Carbohydrates (g)"]
-                total_nutrients["Fat (g)"] += row["Fat (g)"]
-
-        meal_plans[meal_category] = meal_plan
-
-    # Check if the total nutrient intake is within the specified ranges
-    if protein_range and not (protein_range[0] <= total_nutrients["Protein (g)"] <= protein_range[1]):
-        st.warning("Total protein intake is out of the specified range!")
-    if carb_range and not (carb_range[0] <= total_nutrients["Carbohydrates (g)"] <= carb_range[1]):
-        st.warning("Total carbohydrate intake is out of the specified range!")
-    if fat_range and not (fat_range[0] <= total_nutrients["Fat (g)"] <= fat_range[1]):
-        st.warning("Total fat intake is out of the specified range!")
-
-    return meal_plans
+# Function to build the export of a stored plan; given to a download button, it only runs when the button is clicked
+def export_stored_plan(plan_id, export_format, patient_name=None):
+    from plan_cache import load_plan
 
+    return "".join(export_chunks(plan_days(plan_id, load_plan(plan_id), patient_name), export_format))
 
+
+@timed("meal plan display")
 def display_meal_plan(meal_plan):
 
   total_calories = 0
@@ -191,14 +92,6 @@ def display_meal_plan(meal_plan):
       total_calories += meal_info['Calories']  # Add calories to total
   st.info(f"Total Calories of day meals : **{total_calories}** kcal")  # Display total calories
 
-# Function to read patient data
-def read_patient_data():
-    try:
-        patient_df = pd.read_csv(DATA_FILE)
-        return patient_df
-    except FileNotFoundError:
-        st.error("Patient data file not found.")
-        return None
 
 
 
@@ -206,6 +99,7 @@ def read_patient_data():
 
 
 
+@timed("patient page rerun")
 def user_input_page():
     if "show_second_page" not in st.session_state or not st.session_state.show_second_page:
       st.title("Ai Calorie Calculator and Meal Generator")
@@ -235,29 +129,16 @@ def user_input_page():
 
 
 
-    # Calculate BMI
-    bmi = calculate_bmi(weight, height)
-
-    # Calculate total body water (TBW)
-    tbw = calculate_tbw(weight, height, age, gender)
-
-    # Calculate ideal weight
-    ideal_weight = calculate_ideal_weight(height, gender)
-
     # Calculate body fat mass
     body_fat_mass = weight * (body_fat_percentage / 100)
 
-    # Calculate BMR
-    bmr = calculate_bmr(weight, height, age, gender)
-
-    # Calculate TDEE
+    # Select the activity level for the TDEE
     activity_level = st.selectbox("Select your activity level",
                                   options=[
                                       "Sedentary", "Lightly active",
                                       "Moderately active", "Very active",
                                       "Extra active"
                                   ])
-    tdee = calculate_tdee(bmr, activity_level)
 
     # Dietary goals selection
 
@@ -293,14 +174,35 @@ def user_input_page():
         protein_range = st.slider('Protein (g)', min_value=0, max_value=200, value=(0, 113))
         carb_range = st.slider('Carbohydrates (g)', min_value=0, max_value=200, value=(0, 100))
 
+    engine = st.radio("Meal generation engine", options=ENGINES, format_func=str.capitalize, horizontal=True)
+    variety_days = st.number_input("Days before a meal can be repeated in the week", min_value=0, max_value=6, value=1, step=1)
+    candidates = st.number_input("Candidate plans to pick the best from", min_value=1, max_value=256, value=1, step=1)
+
+    # Allergies, sensitivities and disliked ingredients of the patient; the catalog is only loaded to list them
+    exclude = None
+    if st.checkbox("Exclude meals (allergies, sensitivities, disliked ingredients)"):
+        from meal_catalog import load_meal_catalog
+        from meal_filters import filter_values
+
+        meals_df = load_meal_catalog()
+        exclude = {
+            "Sensitivity": st.multiselect("Exclude meal sensitivities", options=filter_values(meals_df, "Sensitivity")),
+            "Meal Type": st.multiselect("Exclude meal types", options=filter_values(meals_df, "Meal Type")),
+            "Ingredients": st.multiselect("Exclude ingredients", options=filter_values(meals_df, "Ingredients")),
+        }
 
 
 
-    # Calculate calorie intake
-    calorie_intake = calculate_calorie_intake(tdee, goals, weight, ideal_weight)
 
-    # Read meals from CSV
-    meals_df = pd.read_csv("food.csv", encoding='utf-8-sig')
+    # Calculate BMI, TBW, ideal weight, BMR, TDEE and calorie intake, reusing the results of the previous rerun
+    # while the inputs are unchanged
+    metrics = memoize("metrics", (age, gender, weight, height, activity_level, tuple(goals)), calculate_metrics, age, gender, weight, height, activity_level, goals)
+    bmi = metrics["bmi"]
+    tbw = metrics["tbw"]
+    ideal_weight = metrics["ideal_weight"]
+    bmr = metrics["bmr"]
+    tdee = metrics["tdee"]
+    calorie_intake = metrics["calorie_intake"]
 
 
 
@@ -390,6 +292,17 @@ def user_input_page():
     st.success(
             f"Recommended Daily Calorie Intake *According to your weight plan*: {calorie_intake:.2f} kcal/day")
 
+    # Calorie intake of the patient at other weights, calculated for the whole range at once
+    if st.checkbox("Show the calorie intake at other weights"):
+        import numpy as np
+        import pandas as pd
+        from patient_metrics import calorie_intake_grid
+
+        low, high = st.slider("Weights (kg)", min_value=30, max_value=200, value=(60, 120))
+        weights = np.arange(low, high + 1)
+        intakes = calorie_intake_grid(weights, height, age, gender, activity_level, goals)
+        st.line_chart(pd.DataFrame({"Calorie intake (kcal/day)": intakes}, index=pd.Index(weights, name="Weight (kg)")))
+
     # Define the range for each nutrient
 
 
@@ -401,7 +314,10 @@ def user_input_page():
 
     # Display Meals
     if st.button("Generate meals"):
-        meal_plan = generate_meal_plan(calorie_intake, meals_df, protein_range, carb_range, fat_range)
+        # Every click asks for new plans
+        plan_round(new=True)
+        plan_id, meal_plan = generate_meal_plan(patient_name, calorie_intake, protein_range, carb_range, fat_range, engine, exclude, candidates)
+        st.caption(f"Plan ID: {plan_id}")
         display_meal_plan(meal_plan)
 
 
@@ -412,27 +328,41 @@ def user_input_page():
 
     details = st.button("Generate Meals for Week")
     if details:
-        st.markdown(f"<h1 style='text-align: center;font-family: tahoma; font-size: 22px;background-color: #FFB6C1;'>اليوم الأول</h1>", unsafe_allow_html=True)
-        meal_plan = generate_meal_plan(calorie_intake, meals_df, protein_range, carb_range, fat_range)
-        display_meal_plan(meal_plan)
-        st.markdown(f"<h1 style='text-align: center;font-family: tahoma; font-size: 22px;background-color: #FFB6C1;'>اليوم الثاني</h1>", unsafe_allow_html=True)
-        meal_plan = generate_meal_plan(calorie_intake, meals_df, protein_range, carb_range, fat_range)
-        display_meal_plan(meal_plan)
-        st.markdown(f"<h1 style='text-align: center;font-family: tahoma; font-size: 22px;background-color: #FFB6C1;'>اليوم الثالث</h1>", unsafe_allow_html=True)
-        meal_plan = generate_meal_plan(calorie_intake, meals_df, protein_range, carb_range, fat_range)
-        display_meal_plan(meal_plan)
-        st.markdown(f"<h1 style='text-align: center;font-family: tahoma; font-size: 22px;background-color: #FFB6C1;'>اليوم الرابع</h1>", unsafe_allow_html=True)
-        meal_plan = generate_meal_plan(calorie_intake, meals_df, protein_range, carb_range, fat_range)
-        display_meal_plan(meal_plan)
-        st.markdown(f"<h1 style='text-align: center;font-family: tahoma; font-size: 22px;background-color: #FFB6C1;'>اليوم الخامس</h1>", unsafe_allow_html=True)
-        meal_plan = generate_meal_plan(calorie_intake, meals_df, protein_range, carb_range, fat_range)
-        display_meal_plan(meal_plan)
-        st.markdown(f"<h1 style='text-align: center;font-family: tahoma; font-size: 22px;background-color: #FFB6C1;'>اليوم السادس</h1>", unsafe_allow_html=True)
-        meal_plan = generate_meal_plan(calorie_intake, meals_df, protein_range, carb_range, fat_range)
-        display_meal_plan(meal_plan)
-        st.markdown(f"<h1 style='text-align: center;font-family: tahoma; font-size: 22px;background-color: #FFB6C1;'>اليوم السابع</h1>", unsafe_allow_html=True)
-        meal_plan = generate_meal_plan(calorie_intake, meals_df, protein_range, carb_range, fat_range)
-        display_meal_plan(meal_plan)
+        plan_round(new=True)
+        st.session_state["shown_plan_id"], week_plan = generate_session_plans(patient_name, calorie_intake, len(DAY_NAMES), protein_range, carb_range, fat_range, engine, variety_days, exclude, candidates)
+
+    # Print a stored plan again from its plan ID
+    stored_plan_id = st.text_input("Plan ID of a stored plan")
+    if stored_plan_id and st.button("Show stored plan"):
+        from plan_cache import load_plan
+
+        if load_plan(stored_plan_id.strip()) is None:
+            st.error("No stored plan with this ID.")
+        else:
+            st.session_state["shown_plan_id"] = stored_plan_id.strip()
+
+    # The shown plan stays on the page while another day is picked; only the picked day is rendered,
+    # as one table per meal category
+    shown_plan_id = st.session_state.get("shown_plan_id")
+    if shown_plan_id:
+        from meal_ingredients import shopping_list
+        from plan_cache import load_plan
+
+        st.caption(f"Plan ID: {shown_plan_id}")
+        day_name, meal_plan = select_plan_day(load_plan(shown_plan_id), DAY_NAMES, "shown_plan_day")
+        st.markdown(f"<h1 style='text-align: center;font-family: tahoma; font-size: 22px;background-color: #FFB6C1;'>{day_name}</h1>", unsafe_allow_html=True)
+        show_nutrient_warnings(meal_plan, protein_range, carb_range, fat_range)
+        display_day_table(meal_plan)
+        with st.expander("Shopping list of the plan"):
+            shown_plan = load_plan(shown_plan_id)
+            st.dataframe(shopping_list([meal_info for day_plan in shown_plan for meals in day_plan.values() for meal_info in meals]), use_container_width=True)
+
+        # Export of the whole plan, to print it or to open it in a spreadsheet
+        for column, export_format in zip(st.columns(len(EXPORT_FORMATS)), EXPORT_FORMATS):
+            column.download_button(
+                f"Export {export_format.upper()}", data=functools.partial(export_stored_plan, shown_plan_id, export_format, patient_name),
+                file_name=f"plan_{shown_plan_id}.{export_format}", mime=MEDIA_TYPES[export_format],
+            )
 
 
 
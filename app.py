@@ -1,84 +1,19 @@
 import streamlit as st
-import pandas as pd
-import csv
-import os
 import datetime
-import random
+from body_metrics import calculate_metrics, fitness_goal
+from meal_engines import ENGINES, GREEDY_ENGINE
+from plan_view import display_day_table, select_plan_day
+from session_memo import memoize, plan_round
+from timings import timed
 
-
-# Define the file path for storing patient data
-DATA_FILE = "patient_data.csv"
-
-# Function to save patient data
-def save_patient_data(patient_data):
-    fieldnames = patient_data.keys()
-    file_exists = os.path.exists(DATA_FILE)
-    with open(DATA_FILE, mode='a', newline='') as file:
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        if not file_exists:
-            writer.writeheader()
-        # Add current date and time to the patient data
-        patient_data["datetime"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current date and time
-        writer.writerow(patient_data)
-
-
-
-def calculate_bmi(weight, height):
-  return weight / ((height / 100)**2)
-
-# Function to calculate sum of numbers
-def calculate_sum(numbers):
-    return sum(numbers)
-
-
-def calculate_ideal_weight(height, gender):
-  if gender == "Male":
-    return 50 + 0.91 * (height - 152.4)
-  elif gender == "Female":
-    return 45.5 + 0.91 * (height - 152.4)
-  else:
-    return None
-
-
-def calculate_ideal_body_weight(height, gender):
-  if gender == "Male":
-    return 50 + 0.91 * (height - 152.4)
-  elif gender == "Female":
-    return 45.5 + 0.91 * (height - 152.4)
-  else:
-    return None
-
-
-def calculate_body_fat_percentage(weight, body_fat_mass):
-  return (body_fat_mass / weight) * 100
-
-
-def calculate_bmr(weight, height, age, gender):
-  if gender == "Male":
-    return 10 * weight + 6.25 * height - 5 * age + 5
-  elif gender == "Female":
-    return 10 * weight + 6.25 * height - 5 * age - 161
-  else:
-    return None
-
-
-def calculate_tdee(bmr, activity_level):
-  activity_factors = {
-      "Sedentary": 1.2,
-      "Lightly active": 1.375,
-      "Moderately active": 1.55,
-      "Very active": 1.725,
-      "Extra active": 1.9
-  }
-  return bmr * activity_factors[activity_level]
+# The plan store and the planner pull in pandas and NumPy; they are imported where the meals are generated
 
 
+# This page takes 1000 kcal/day off for a rapid weight loss on top of a weight loss goal only
 def calculate_calorie_intake(tdee, goals, weight, ideal_weight):
+  goals = set(goals)
   if "Fitness" in goals:
-    if weight < ideal_weight:
-      goals.append("Weight gain")
-    elif weight > ideal_weight:
-      goals.append("Weight loss")
+    goals.add(fitness_goal(weight, ideal_weight))
   if "Weight loss" in goals:
     if "Rapid Weight Loss" in goals:
       return tdee - 1000  # Subtract 1000 kcal/day for rapid weight loss
@@ -92,71 +27,26 @@ def calculate_calorie_intake(tdee, goals, weight, ideal_weight):
     return tdee
 
 
-def calculate_tbw(weight, height, age, gender):
-  if gender == "Male":
-    k = 2.447 - 0.09516 * age + 0.1074 * height + 0.3362 * weight
-  elif gender == "Female":
-    k = -2.097 + 0.1069 * height + 0.2466 * weight
-  else:
-    return None
+# Names of the days of a week plan
+DAY_NAMES = ["اليوم الأول", "اليوم الثاني", "اليوم الثالث", "اليوم الرابع", "اليوم الخامس", "اليوم السادس", "اليوم السابع"]
 
-  return 0.3669 * k - 0.0906 * weight + 0.1074 * height + 0.2466 * weight
 
+# Function to generate the meal plans of some days for a patient. The seed comes from the patient name, the date
+# and the plan round of the session, so a rerun with the same inputs gets the same plans from the plan cache.
+# Returns the plan ID and the plans.
+def generate_session_plans(patient_name, calorie_intake, days, engine=GREEDY_ENGINE, variety_days=0):
+    from plan_cache import derive_seed, generate_plan
 
+    seed = derive_seed(patient_name, datetime.date.today().isoformat(), plan_round())
+    return generate_plan(calorie_intake, days, engine=engine, variety_days=variety_days, seed=seed)
 
-def generate_meal_plan(calorie_intake, meals_df):
-    # Define the calorie distribution for each meal category based on the user's input calorie intake
-    meal_categories = {
-        "الفطار":0.20,
-        "الغداء": 0.40,
-        "العشاء": 0.30,
-        "السناكس": 0.10
-    }
-    
-    # Initialize empty dictionary to store meal plans for different categories
-    meal_plans = {}
-
-    # Iterate through meal categories
-    for meal_category, percentage in meal_categories.items():
-        # Calculate the calorie allowance for the specified meal category based on the recommended intake
-        calorie_allowance = calorie_intake * percentage
-
-        # Initialize empty list to store selected meals for the specified category
-        meal_plan = []
-
-        # Filter meals based on the specified category
-        category_meals = meals_df[meals_df["Category"] == meal_category]
-
-        # Randomize the meals
-        category_meals = category_meals.sample(frac=1)
-
-        # Iterate through meals in the specified category
-        for index, row in category_meals.iterrows():
-            meal_name = row["Meal Name"]
-            meal_calories = row["Calories"]
-
-            # Check if the meal fits into the calorie allowance
-            if meal_calories <= calorie_allowance:
-                # Add the meal to the meal plan
-                meal_plan.append({
-                    "Meal": meal_name,
-                    "Calories": meal_calories,
-                    "Ingredients": row["Ingredients"],
-                    "Weight (g)": row["Weight (g)"],
-                    "Protein (g)": row["Protein (g)"],
-                    "Carbohydrates (g)": row["Carbohydrates (g)"],
-                    "Fat (g)": row["Fat (g)"],
-                    "Category": row["Category"],
-                    "Meal Type" : row["Meal Type"]
-                })
-                # Deduct the calories of the meal from the remaining allowance
-                calorie_allowance -= meal_calories
-
-        # Store meal plan for the category
-        meal_plans[meal_category] = meal_plan
-
-    return meal_plans
 
+def generate_meal_plan(patient_name, calorie_intake, engine=GREEDY_ENGINE):
+    # Generate a one day plan with the calorie distribution of meal_planner.MEAL_CATEGORIES
+    plan_id, meal_plans = generate_session_plans(patient_name, calorie_intake, 1, engine)
+    return plan_id, meal_plans[0]
+
+@timed("meal plan display")
 def display_meal_plan(meal_plan):
 
   total_calories = 0
@@ -181,14 +71,6 @@ def display_meal_plan(meal_plan):
       total_calories += meal_info['Calories']  # Add calories to total
   st.info(f"Total Calories of day meals : **{total_calories}** kcal")  # Display total calories
 
-# Function to read patient data
-def read_patient_data():
-    try:
-        patient_df = pd.read_csv(DATA_FILE)
-        return patient_df
-    except FileNotFoundError:
-        st.error("Patient data file not found.")
-        return None
 
 
 
@@ -196,6 +78,7 @@ def read_patient_data():
 
 
 
+@timed("patient page rerun")
 def user_input_page():
     if "show_second_page" not in st.session_state or not st.session_state.show_second_page:
       st.title("Ai Calorie Calculator and Meal Generator")
@@ -221,29 +104,16 @@ def user_input_page():
     waist_to_hip_ratio = st.number_input("Enter your waist-to-hip ratio", min_value=0.0, step=0.01)
     lean_body_mass = st.number_input("Enter your lean body mass (kg)", min_value=5.0, step=0.1)
 
-    # Calculate BMI
-    bmi = calculate_bmi(weight, height)
-
-    # Calculate total body water (TBW)
-    tbw = calculate_tbw(weight, height, age, gender)
-
-    # Calculate ideal weight
-    ideal_weight = calculate_ideal_weight(height, gender)
-
     # Calculate body fat mass
     body_fat_mass = weight * (body_fat_percentage / 100)
 
-    # Calculate BMR
-    bmr = calculate_bmr(weight, height, age, gender)
-
-    # Calculate TDEE
+    # Select the activity level for the TDEE
     activity_level = st.selectbox("Select your activity level",
                                   options=[
                                       "Sedentary", "Lightly active",
                                       "Moderately active", "Very active",
                                       "Extra active"
                                   ])
-    tdee = calculate_tdee(bmr, activity_level)
 
     # Dietary goals selection
     st.sidebar.subheader("Select your dietary goals:")
@@ -265,11 +135,15 @@ def user_input_page():
     if rapid_weight_loss:
         goals.append("Rapid Weight Loss")
 
-    # Calculate calorie intake
-    calorie_intake = calculate_calorie_intake(tdee, goals, weight, ideal_weight)
-
-    # Read meals from CSV
-    meals_df = pd.read_csv("food.csv", encoding='utf-8-sig')
+    # Calculate BMI, TBW, ideal weight, BMR, TDEE and calorie intake, reusing the results of the previous rerun
+    # while the inputs are unchanged
+    metrics = memoize("metrics", (age, gender, weight, height, activity_level, tuple(goals)), calculate_metrics, age, gender, weight, height, activity_level, goals, calculate_calorie_intake)
+    bmi = metrics["bmi"]
+    tbw = metrics["tbw"]
+    ideal_weight = metrics["ideal_weight"]
+    bmr = metrics["bmr"]
+    tdee = metrics["tdee"]
+    calorie_intake = metrics["calorie_intake"]
 
     # Buttons
     if st.button("Save Patient Data"):
@@ -361,36 +235,27 @@ def user_input_page():
 
     
     # Display Meals
+    engine = st.sidebar.radio("Meal generation engine", options=ENGINES, format_func=str.capitalize)
+    variety_days = st.sidebar.number_input("Days before a meal can be repeated in the week", min_value=0, max_value=6, value=1, step=1)
     if st.sidebar.button("Regenerate meals"):
-        meal_plan = generate_meal_plan(calorie_intake, meals_df)
+        # Start a new plan round, the checkboxes below show the new plans too
+        plan_round(new=True)
+        plan_id, meal_plan = generate_meal_plan(patient_name, calorie_intake, engine)
+        st.caption(f"Plan ID: {plan_id}")
         display_meal_plan(meal_plan)
 
     if st.checkbox("Generate Meals for one day"):  
-        meal_plan = generate_meal_plan(calorie_intake, meals_df)
+        plan_id, meal_plan = generate_meal_plan(patient_name, calorie_intake, engine)
+        st.caption(f"Plan ID: {plan_id}")
         display_meal_plan(meal_plan)
     details = st.checkbox("Generate Meals for Week")
     if details:
-        st.markdown(f"<h1 style='text-align: center;font-family: tahoma; font-size: 20px;background-color: #FFB6C1;'>اليوم الأول</h1>", unsafe_allow_html=True)
-        meal_plan = generate_meal_plan(calorie_intake, meals_df)
-        display_meal_plan(meal_plan)
-        st.markdown(f"<h1 style='text-align: center;font-family: tahoma; font-size: 20px;background-color: #FFB6C1;'>اليوم الثاني</h1>", unsafe_allow_html=True)
-        meal_plan = generate_meal_plan(calorie_intake, meals_df)
-        display_meal_plan(meal_plan)
-        st.markdown(f"<h1 style='text-align: center;font-family: tahoma; font-size: 20px;background-color: #FFB6C1;'>اليوم الثالث</h1>", unsafe_allow_html=True)
-        meal_plan = generate_meal_plan(calorie_intake, meals_df)
-        display_meal_plan(meal_plan)
-        st.markdown(f"<h1 style='text-align: center;font-family: tahoma; font-size: 20px;background-color: #FFB6C1;'>اليوم الرابع</h1>", unsafe_allow_html=True)
-        meal_plan = generate_meal_plan(calorie_intake, meals_df)
-        display_meal_plan(meal_plan)
-        st.markdown(f"<h1 style='text-align: center;font-family: tahoma; font-size: 20px;background-color: #FFB6C1;'>اليوم الخامس</h1>", unsafe_allow_html=True)
-        meal_plan = generate_meal_plan(calorie_intake, meals_df)
-        display_meal_plan(meal_plan)
-        st.markdown(f"<h1 style='text-align: center;font-family: tahoma; font-size: 20px;background-color: #FFB6C1;'>اليوم السادس</h1>", unsafe_allow_html=True)
-        meal_plan = generate_meal_plan(calorie_intake, meals_df)
-        display_meal_plan(meal_plan)
-        st.markdown(f"<h1 style='text-align: center;font-family: tahoma; font-size: 20px;background-color: #FFB6C1;'>اليوم السابع</h1>", unsafe_allow_html=True)
-        meal_plan = generate_meal_plan(calorie_intake, meals_df)
-        display_meal_plan(meal_plan)
+        plan_id, week_plan = generate_session_plans(patient_name, calorie_intake, len(DAY_NAMES), engine, variety_days)
+        st.caption(f"Plan ID: {plan_id}")
+        # Only the picked day is rendered, as one table per meal category
+        day_name, meal_plan = select_plan_day(week_plan, DAY_NAMES, "week_plan_day")
+        st.markdown(f"<h1 style='text-align: center;font-family: tahoma; font-size: 20px;background-color: #FFB6C1;'>{day_name}</h1>", unsafe_allow_html=True)
+        display_day_table(meal_plan)
 
 
 
@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from compiled_catalog import open_compiled_catalog, read_current
+from meal_catalog import CATALOG_FILE, NUMERIC_COLUMNS, load_meal_catalog, parse_meal_catalog
+from meal_index import get_meal_index
+from meal_planner import generate_multi_day_plan
+from meal_solver import ENGINES
+from patient_history import load_patient_history, sync_patient_history
+from patient_metrics import calculate_patient_metrics
+from patient_store import PATIENT_FIELDS, migrate_csv, read_patient_data
+from plan_view import meal_plan_html
+
+
+# Benchmarks of the meal planning and patient history hot paths on synthetic data built from the food.csv schema.
+#   python benchmarks.py --sizes 190,10000 --output baseline.json
+#   python benchmarks.py --sizes 190,10000 --compare baseline.json   (exits with 1 when a median got slower)
+
+# Catalog sizes (meals) benchmarked by default; the patient logs get the same number of visits
+DEFAULT_SIZES = [190, 10_000, 100_000, 1_000_000]
+
+# Plan lengths benchmarked, in days
+PLAN_LENGTHS = {"day": 1, "week": 7, "month": 30}
+
+# Visits per synthetic patient
+VISITS_PER_PATIENT = 50
+
+# Slowdown of a median over the baseline that counts as a regression
+DEFAULT_TOLERANCE = 0.25
+
+
+# Function to build a synthetic catalog of `size` meals by resampling the rows of a real catalog.
+# Numbers are scaled by up to +-30% and every meal gets its own name, so the catalog keeps the shape of the real one.
+def synthetic_catalog(size, rng, catalog=CATALOG_FILE):
+    source_df = load_meal_catalog(catalog)
+    meals_df = source_df.iloc[rng.integers(0, len(source_df), size)].reset_index(drop=True)
+    for column in NUMERIC_COLUMNS[1:]:
+        meals_df[column] = np.round(meals_df[column].to_numpy(dtype=np.float64) * rng.uniform(0.7, 1.3, size))
+    meals_df["Meal Number"] = np.arange(1, size + 1)
+    meals_df["Meal Name"] = meals_df["Meal Name"].astype(str) + " " + meals_df["Meal Number"].astype(str)
+    return meals_df
+
+
+# Function to build a synthetic patient log (patient_data.csv schema) of `size` visits
+def synthetic_patient_log(size, rng):
+    patient_count = max(1, size // VISITS_PER_PATIENT)
+    patients = rng.integers(0, patient_count, size)
+    start = np.datetime64("2024-01-01T08:00:00")
+    return pd.DataFrame({
+        "patient_name": np.char.add("Patient ", patients.astype(str)),
+        "age": rng.integers(18, 80, patient_count)[patients],
+        "gender": np.where(patients % 2, "Male", "Female"),
+        "weight": np.round(rng.normal(80, 12, size), 1),
+        "height": rng.integers(150, 195, patient_count)[patients].astype(np.float64),
+        "body_fat_percentage": np.round(rng.uniform(10, 40, size), 1),
+        "waist_to_hip_ratio": np.round(rng.uniform(0.7, 1.1, size), 2),
+        "lean_body_mass": np.round(rng.uniform(40, 70, size), 1),
+        "datetime": pd.Series(start + np.sort(rng.integers(0, 3 * 365 * 86400, size)).astype("timedelta64[s]")).dt.strftime("%Y-%m-%d %H:%M:%S"),
+    })[PATIENT_FIELDS]
+
+
+# Function to time `repeat` calls of a function (after one warm-up call) and its peak traced memory (one more call).
+# Returns the latency percentiles (ms), the throughput (calls per second) and the peak memory (MB).
+def measure(function, repeat):
+    function()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    timings = np.array(timings) * 1000
+    return {
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "p99_ms": float(np.percentile(timings, 99)),
+        "per_second": float(1000 / timings.mean()),
+        "peak_mb": peak / 2 ** 20,
+    }
+
+
+# Function to run every benchmark of one size in a scratch directory. Returns {benchmark name: measurements}.
+def run_size(size, repeat, rng, directory, engines=ENGINES):
+    results = {}
+    catalog_path = os.path.join(directory, f"catalog_{size}.csv")
+    synthetic_catalog(size, rng).to_csv(catalog_path, index=False)
+
+    def load_catalog():
+        # Read and parse the file every time, load_meal_catalog would answer from its cache
+        with open(catalog_path, mode='rb') as file:
+            return parse_meal_catalog(file.read())
+
+    results["catalog load"] = measure(load_catalog, max(1, repeat // 4))
+    meals_df = load_meal_catalog(catalog_path)
+    results["compiled catalog map"] = measure(lambda: open_compiled_catalog(catalog_path, read_current(catalog_path)), repeat)
+    get_meal_index(meals_df)
+
+    for engine in engines:
+        for plan_name, days in PLAN_LENGTHS.items():
+            plan_rng = np.random.default_rng(0)
+            results[f"{engine} {plan_name} plan"] = measure(
+                lambda: generate_multi_day_plan(2000, meals_df, days, engine=engine, variety_days=1, rng=plan_rng), repeat
+            )
+
+    week_plan = generate_multi_day_plan(2000, meals_df, 7, rng=np.random.default_rng(0))
+    results["week plan html"] = measure(lambda: [meal_plan_html(meal_plan) for meal_plan in week_plan], repeat)
+    results["week plan html"]["payload_kb"] = sum(len(meal_plan_html(meal_plan).encode("utf-8")) for meal_plan in week_plan) / 1024
+
+    log_path = os.path.join(directory, f"patients_{size}.csv")
+    database_path = os.path.join(directory, f"patients_{size}.db")
+    history_directory = os.path.join(directory, f"history_{size}")
+    patient_log_df = synthetic_patient_log(size, rng)
+    patient_log_df.to_csv(log_path, index=False)
+    migrate_csv(log_path, database_path)
+    sync_patient_history(database_path, history_directory)
+    patient_name = patient_log_df["patient_name"].iloc[0]
+
+    results["patient database read"] = measure(lambda: read_patient_data(patient_name, database_path), repeat)
+    results["patient history load"] = measure(lambda: calculate_patient_metrics(load_patient_history(patient_name, history_directory)), repeat)
+    return results
+
+
+# Function to print the results as a table
+def print_results(all_results):
+    print(f"{'size':>9}  {'benchmark':<24} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'per s':>10} {'peak MB':>9}")
+    for size, results in all_results.items():
+        for name, measurement in results.items():
+            extra = f"  {measurement['payload_kb']:.1f} KB" if "payload_kb" in measurement else ""
+            print(
+                f"{size:>9}  {name:<24} {measurement['p50_ms']:>10.2f} {measurement['p95_ms']:>10.2f} {measurement['p99_ms']:>10.2f} "
+                f"{measurement['per_second']:>10.1f} {measurement['peak_mb']:>9.2f}{extra}"
+            )
+
+
+# Function to list the benchmarks whose median is more than `tolerance` slower than in the baseline
+def find_regressions(all_results, baseline, tolerance):
+    regressions = []
+    for size, results in all_results.items():
+        for name, measurement in results.items():
+            previous = baseline.get(str(size), {}).get(name)
+            if previous is not None and measurement["p50_ms"] > previous["p50_ms"] * (1 + tolerance):
+                regressions.append(f"{size} {name}: {previous['p50_ms']:.2f} ms -> {measurement['p50_ms']:.2f} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark meal planning and patient history loading on synthetic data.")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES), help="comma separated catalog / patient log sizes")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="comma separated plan engines to benchmark")
+    parser.add_argument("--repeat", type=int, default=20, help="timed calls per benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to check the medians against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown of a median (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    all_results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in [int(size) for size in args.sizes.split(",")]:
+            all_results[size] = run_size(size, args.repeat, rng, directory, args.engines.split(","))
+    print_results(all_results)
+
+    if args.output:
+        with open(args.output, mode='w', encoding='utf-8') as file:
+            json.dump(all_results, file, indent=2)
+    if args.compare:
+        with open(args.compare, mode='r', encoding='utf-8') as file:
+            regressions = find_regressions(all_results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+from timings import timed
+
+
+def calculate_bmi(weight, height):
+  return weight / ((height / 100)**2)
+
+# Function to calculate sum of numbers
+def calculate_sum(numbers):
+    return sum(numbers)
+
+
+def calculate_ideal_weight(height, gender):
+  if gender == "Male":
+    return 50 + 0.91 * (height - 152.4)
+  elif gender == "Female":
+    return 45.5 + 0.91 * (height - 152.4)
+  else:
+    return None
+
+
+def calculate_ideal_body_weight(height, gender):
+  if gender == "Male":
+    return 50 + 0.91 * (height - 152.4)
+  elif gender == "Female":
+    return 45.5 + 0.91 * (height - 152.4)
+  else:
+    return None
+
+
+def calculate_body_fat_percentage(weight, body_fat_mass):
+  return (body_fat_mass / weight) * 100
+
+
+def calculate_bmr(weight, height, age, gender):
+  if gender == "Male":
+    return 10 * weight + 6.25 * height - 5 * age + 5
+  elif gender == "Female":
+    return 10 * weight + 6.25 * height - 5 * age - 161
+  else:
+    return None
+
+
+# Activity factors used to calculate the TDEE from the BMR
+ACTIVITY_FACTORS = {
+    "Sedentary": 1.2,
+    "Lightly active": 1.375,
+    "Moderately active": 1.55,
+    "Very active": 1.725,
+    "Extra active": 1.9
+}
+
+
+def calculate_tdee(bmr, activity_level):
+  return bmr * ACTIVITY_FACTORS[activity_level]
+
+
+# Calorie offset of each weight goal, in order of precedence: the first of these goals the patient has sets the offset
+GOAL_OFFSETS = {
+    "Weight loss": -500,
+    "Rapid Weight Loss": -1000,  # Subtract 1000 kcal/day for rapid weight loss
+    "Weight gain": 500
+}
+
+
+# Function to get the goal of the "Fitness" goal: gaining or losing weight towards the ideal weight, or None at it
+def fitness_goal(weight, ideal_weight):
+  if weight < ideal_weight:
+    return "Weight gain"
+  elif weight > ideal_weight:
+    return "Weight loss"
+  return None
+
+
+# Function to get the calorie offset of the weight goals. The goals are only read, so any iterable will do.
+def calculate_calorie_offset(goals, weight, ideal_weight):
+  goals = set(goals)
+  if "Fitness" in goals:
+    goals.add(fitness_goal(weight, ideal_weight))
+  for goal, offset in GOAL_OFFSETS.items():
+    if goal in goals:
+      return offset
+  # No calorie adjustment for maintenance, nor for a fitness goal at the ideal weight
+  return 0
+
+
+def calculate_calorie_intake(tdee, goals, weight, ideal_weight):
+  return tdee + calculate_calorie_offset(goals, weight, ideal_weight)
+
+
+def calculate_tbw(weight, height, age, gender):
+  if gender == "Male":
+    k = 2.447 - 0.09516 * age + 0.1074 * height + 0.3362 * weight
+  elif gender == "Female":
+    k = -2.097 + 0.1069 * height + 0.2466 * weight
+  else:
+    return None
+
+  return 0.3669 * k - 0.0906 * weight + 0.1074 * height + 0.2466 * weight
+
+
+# Function to calculate the metrics shown on the patient page in one call, so they can be memoized together.
+# A page with its own goal adjustments passes its own `intake_function` (same arguments as calculate_calorie_intake).
+@timed("metric calculation")
+def calculate_metrics(age, gender, weight, height, activity_level, goals, intake_function=calculate_calorie_intake):
+  bmr = calculate_bmr(weight, height, age, gender)
+  tdee = calculate_tdee(bmr, activity_level)
+  ideal_weight = calculate_ideal_weight(height, gender)
+  return {
+      "bmi": calculate_bmi(weight, height),
+      "tbw": calculate_tbw(weight, height, age, gender),
+      "ideal_weight": ideal_weight,
+      "bmr": bmr,
+      "tdee": tdee,
+      "calorie_intake": intake_function(tdee, goals, weight, ideal_weight),
+  }
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+
+# Most points sent to the browser for one chart
+CHART_POINTS = 500
+
+
+# Function to build the chart frame of a patient history once: the chart columns indexed by visit time
+def build_chart_frame(history_df, columns):
+    chart_df = history_df[columns].copy()
+    chart_df.index = pd.DatetimeIndex(pd.to_datetime(history_df["datetime"]), name="datetime")
+    if not chart_df.index.is_monotonic_increasing:
+        chart_df = chart_df.sort_index(kind="stable")
+    return chart_df
+
+
+# Function to cut the visits between two dates (both included) out of a chart frame, by binary search on its index
+def window_chart_frame(chart_df, start=None, end=None):
+    first = 0 if start is None else chart_df.index.searchsorted(pd.Timestamp(start), side="left")
+    last = len(chart_df) if end is None else chart_df.index.searchsorted(pd.Timestamp(end) + pd.Timedelta(days=1), side="left")
+    return chart_df.iloc[first:last]
+
+
+# Function to pick the points of a series that keep its shape (Largest-Triangle-Three-Buckets).
+# Returns the positions of at most `threshold` points, always including the first and the last one.
+def lttb_indices(x, y, threshold):
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # threshold - 2 buckets between the first and the last point; the last "next bucket" is the last point
+    edges = np.append(np.linspace(1, size - 1, threshold - 1).astype(np.intp), size)
+    picked = np.empty(threshold, dtype=np.intp)
+    picked[0] = 0
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, stop, next_stop = edges[bucket], edges[bucket + 1], edges[bucket + 2]
+        average_x = x[stop:next_stop].mean()
+        average_y = y[stop:next_stop].mean()
+        areas = np.abs(
+            (x[previous] - average_x) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (average_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        picked[bucket + 1] = previous
+    picked[-1] = size - 1
+    return picked
+
+
+# Function to pick the smallest and the largest point of every column in each of a fixed number of buckets.
+# Returns the sorted positions of at most about `max_points` points, always including the first and the last one.
+def min_max_indices(values, max_points):
+    values = np.asarray(values, dtype=np.float64).reshape(len(values), -1)
+    size, column_count = values.shape
+    if size <= max_points:
+        return np.arange(size)
+
+    bucket_count = max(1, (max_points - 2) // (2 * column_count))
+    edges = np.linspace(0, size, bucket_count + 1).astype(np.intp)
+    low = np.where(np.isnan(values), np.inf, values)
+    high = np.where(np.isnan(values), -np.inf, values)
+    picked = [np.array([0, size - 1])]
+    for start, stop in zip(edges[:-1], edges[1:]):
+        picked.append(start + np.argmin(low[start:stop], axis=0))
+        picked.append(start + np.argmax(high[start:stop], axis=0))
+    return np.unique(np.concatenate(picked))
+
+
+# Function to get the chart data of some columns for a date range, reduced to at most about `max_points` points.
+# A single series is reduced with LTTB, several series with min/max bucketing so no column loses its peaks.
+def chart_window(chart_df, columns, start=None, end=None, max_points=CHART_POINTS):
+    window_df = window_chart_frame(chart_df, start, end)[columns]
+    if len(window_df) <= max_points:
+        return window_df
+    if len(columns) == 1:
+        x = window_df.index.to_numpy().astype(np.int64)
+        positions = lttb_indices(x, window_df[columns[0]].to_numpy(dtype=np.float64), max_points)
+    else:
+        positions = min_max_indices(window_df.to_numpy(dtype=np.float64), max_points)
+    return window_df.iloc[positions]
@@ -0,0 +1,142 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+# Compiled form of a meal catalog, for fast startup: every numeric column is a fixed-width .npy file and every text
+# (categorical) column holds codes into its category list, whose strings are one UTF-8 buffer plus their offsets.
+# The files are memory-mapped, so every process reading the same compiled catalog shares one copy in the page cache.
+# With pyarrow the category strings are used in place as Arrow strings, so even the meal names and ingredients are
+# never copied into a process; only the rows that become meal records are converted to Python strings.
+#
+#   food.catalog/current.json             the compiled version, and the size and mtime of the CSV it was compiled from
+#   food.catalog/<version>-<format>/...   the column files of that version
+
+# Name of the file pointing at the current compiled version
+CURRENT_FILE = "current.json"
+
+# Version of the layout below; a catalog compiled with another layout is compiled again
+CATALOG_FORMAT = 3
+
+
+# Function to get the directory of the compiled form of a catalog file
+def compiled_directory(path):
+    return os.path.splitext(path)[0] + ".catalog"
+
+
+# Function to get the smallest code type pandas uses for a number of categories, so the codes are never copied
+def _code_type(category_count):
+    for dtype in (np.int8, np.int16, np.int32):
+        if category_count < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+# Function to read the pointer to the current compiled version of a catalog, or None when it was never compiled
+def read_current(path):
+    try:
+        with open(os.path.join(compiled_directory(path), CURRENT_FILE), mode='r', encoding='utf-8') as file:
+            current = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return current if current.get("format") == CATALOG_FORMAT else None
+
+
+# Function to compile a parsed catalog (meal_catalog.parse_meal_catalog) of the given version and file signature.
+# The new version is written next to the old one and the pointer is replaced in one step, so readers never see a
+# half-written catalog. A version already compiled is only pointed at again.
+def compile_catalog(meals_df, path, version, signature):
+    directory = compiled_directory(path)
+    name = f"{version[:16]}-{CATALOG_FORMAT}"
+    os.makedirs(directory, exist_ok=True)
+    if not os.path.exists(os.path.join(directory, name, "columns.json")):
+        _write_columns(meals_df, directory, name)
+
+    current = {"format": CATALOG_FORMAT, "version": version, "signature": list(signature), "directory": name}
+    current_path = os.path.join(directory, CURRENT_FILE)
+    with open(f"{current_path}.{os.getpid()}.tmp", mode='w', encoding='utf-8') as file:
+        json.dump(current, file)
+    os.replace(f"{current_path}.{os.getpid()}.tmp", current_path)
+
+    # Remove the older versions. One still mapped by another process cannot be removed on Windows; it is left for the
+    # next compile.
+    for old_name in os.listdir(directory):
+        if old_name != name and os.path.isdir(os.path.join(directory, old_name)) and not old_name.endswith(".tmp"):
+            shutil.rmtree(os.path.join(directory, old_name), ignore_errors=True)
+    return current
+
+
+# Function to write the column files of a catalog version. They are written in a scratch directory that is then renamed,
+# because files already mapped by another process must never be rewritten.
+def _write_columns(meals_df, directory, name):
+    version_directory = os.path.join(directory, f"{name}.{os.getpid()}.tmp")
+    os.makedirs(version_directory, exist_ok=True)
+
+    columns = []
+    for number, column in enumerate(meals_df.columns):
+        values = meals_df[column]
+        file_name = f"column_{number}"
+        if pd.api.types.is_numeric_dtype(values.dtype):
+            np.save(os.path.join(version_directory, file_name + ".npy"), values.to_numpy())
+            columns.append({"name": column, "kind": "numeric", "file": file_name})
+            continue
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Keep the categories in their order
+            codes, categories = values.cat.codes.to_numpy(), values.cat.categories
+        else:
+            codes, categories = values.factorize()
+        encoded = [category.encode("utf-8") for category in categories.tolist()]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(category) for category in encoded])
+        np.save(os.path.join(version_directory, file_name + ".npy"), codes.astype(_code_type(len(categories))))
+        np.save(os.path.join(version_directory, file_name + ".offsets.npy"), offsets)
+        np.save(os.path.join(version_directory, file_name + ".strings.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        # The dtype of the category strings ("str" or "string"), so the categories come back as they were compiled
+        columns.append({"name": column, "kind": "text", "file": file_name, "categories": str(categories.dtype)})
+
+    with open(os.path.join(version_directory, "columns.json"), mode='w', encoding='utf-8') as file:
+        json.dump({"rows": len(meals_df), "columns": columns}, file, ensure_ascii=False)
+    try:
+        os.rename(version_directory, os.path.join(directory, name))
+    except OSError:
+        # Another process compiled the same version first
+        shutil.rmtree(version_directory, ignore_errors=True)
+
+
+# Function to read the category strings of a text column. With pyarrow (the storage of pandas strings) they are
+# Arrow strings over the memory-mapped buffers; otherwise they are decoded.
+def _read_categories(version_directory, column):
+    offsets = np.load(os.path.join(version_directory, column["file"] + ".offsets.npy"), mmap_mode="r")
+    strings = np.load(os.path.join(version_directory, column["file"] + ".strings.npy"), mmap_mode="r")
+    dtype = pd.api.types.pandas_dtype(column["categories"])
+    if pyarrow is not None and getattr(dtype, "storage", None) == "pyarrow":
+        array = pyarrow.Array.from_buffers(pyarrow.large_string(), len(offsets) - 1, [None, pyarrow.py_buffer(offsets), pyarrow.py_buffer(strings)])
+        return pd.Index(pd.arrays.ArrowStringArray(pyarrow.chunked_array([array]), dtype=dtype), copy=False)
+    raw = strings.tobytes()
+    return pd.Index([raw[start:stop].decode("utf-8") for start, stop in zip(offsets[:-1].tolist(), offsets[1:].tolist())], dtype=dtype)
+
+
+# Function to open a compiled catalog as a DataFrame whose numeric columns, text codes and category strings are
+# memory-mapped. Text columns come back as categoricals, as meal_catalog.parse_meal_catalog gives them.
+def open_compiled_catalog(path, current):
+    version_directory = os.path.join(compiled_directory(path), current["directory"])
+    with open(os.path.join(version_directory, "columns.json"), mode='r', encoding='utf-8') as file:
+        layout = json.load(file)
+
+    columns = {}
+    for column in layout["columns"]:
+        values = np.load(os.path.join(version_directory, column["file"] + ".npy"), mmap_mode="r")
+        if column["kind"] == "numeric":
+            columns[column["name"]] = values
+            continue
+        categories = _read_categories(version_directory, column)
+        columns[column["name"]] = pd.Series(pd.Categorical.from_codes(values, categories=categories, validate=False), copy=False)
+    return pd.DataFrame(columns, copy=False)
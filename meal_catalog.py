@@ -0,0 +1,112 @@
+import hashlib
+import io
+import os
+import threading
+
+import pandas as pd
+
+from compiled_catalog import compile_catalog, compiled_directory, open_compiled_catalog, read_current
+from timings import timed, timer
+
+
+# Define the default file path of the meal catalog
+CATALOG_FILE = "food.csv"
+
+# Columns converted to numbers and to categories when the catalog is parsed
+NUMERIC_COLUMNS = ["Meal Number", "Calories", "Weight (g)", "Protein (g)", "Carbohydrates (g)", "Fat (g)"]
+CATEGORICAL_COLUMNS = ["Category", "Meal Type", "Sensitivity", "Meal Category"]
+
+# Parsed catalogs for this process, keyed by absolute file path
+_catalog_cache = {}
+_catalog_lock = threading.Lock()
+
+
+# Function to parse the raw catalog bytes into a typed DataFrame
+def parse_meal_catalog(raw):
+    meals_df = pd.read_csv(io.BytesIO(raw), encoding='utf-8-sig')
+    for column in NUMERIC_COLUMNS:
+        if column in meals_df.columns:
+            meals_df[column] = pd.to_numeric(meals_df[column], errors="coerce")
+    for column in CATEGORICAL_COLUMNS:
+        if column in meals_df.columns:
+            # Some rows carry trailing spaces (e.g. in "Category"), strip them before categorising
+            meals_df[column] = meals_df[column].astype("string").str.strip().astype("category")
+    # The other text columns (meal names, ingredients) are categorised as they are, so a compiled catalog can keep
+    # them as codes into its shared strings
+    for column in meals_df.columns:
+        if not pd.api.types.is_numeric_dtype(meals_df[column].dtype) and not isinstance(meals_df[column].dtype, pd.CategoricalDtype):
+            meals_df[column] = meals_df[column].astype("category")
+    return meals_df
+
+
+# Function to load the meal catalog, parsing the file only when it has changed.
+# A parsed catalog is also compiled next to the file (compiled_catalog), so the next process memory-maps it instead of
+# parsing the file again.
+# The returned DataFrame is shared between reruns and sessions, so callers must not modify it in place.
+@timed("catalog load")
+def load_meal_catalog(path=CATALOG_FILE):
+    key = os.path.abspath(path)
+    stat = os.stat(key)
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    entry = _catalog_cache.get(key)
+    if entry is not None and entry["signature"] == signature:
+        return entry["meals_df"]
+
+    with _catalog_lock:
+        entry = _catalog_cache.get(key)
+        if entry is not None and entry["signature"] == signature:
+            return entry["meals_df"]
+
+        current = read_current(key)
+        if current is not None and tuple(current["signature"]) == signature:
+            with timer("catalog map"):
+                meals_df = open_compiled_catalog(key, current)
+            _catalog_cache[key] = {"signature": signature, "version": current["version"], "meals_df": meals_df}
+            return meals_df
+
+        with open(key, mode='rb') as file:
+            raw = file.read()
+        version = hashlib.sha1(raw).hexdigest()
+
+        # The file was touched but its content is the same, keep the parsed catalog
+        if entry is not None and entry["version"] == version:
+            entry["signature"] = signature
+            return entry["meals_df"]
+
+        if current is not None and current["version"] == version:
+            with timer("catalog map"):
+                meals_df = open_compiled_catalog(key, current)
+        else:
+            with timer("catalog parse"):
+                meals_df = parse_meal_catalog(raw)
+        try:
+            compile_catalog(meals_df, key, version, signature)
+        except OSError:
+            # Read-only directory: keep parsing the file in every process
+            pass
+        _catalog_cache[key] = {"signature": signature, "version": version, "meals_df": meals_df}
+        return meals_df
+
+
+# Function to get the file path a loaded catalog DataFrame was loaded from, or None for a DataFrame built otherwise
+def catalog_path_of(meals_df):
+    for path, entry in list(_catalog_cache.items()):
+        if entry["meals_df"] is meals_df:
+            return path
+    return None
+
+
+# Function to get the content hash of the currently loaded catalog
+def catalog_version(path=CATALOG_FILE):
+    load_meal_catalog(path)
+    return _catalog_cache[os.path.abspath(path)]["version"]
+
+
+if __name__ == "__main__":
+    # Compile a catalog ahead of time (e.g. when deploying): python meal_catalog.py [food.csv]
+    import sys
+
+    catalog_path = sys.argv[1] if len(sys.argv) > 1 else CATALOG_FILE
+    load_meal_catalog(catalog_path)
+    print(f"Compiled {catalog_path} (version {catalog_version(catalog_path)[:16]}) into {compiled_directory(catalog_path)}")
@@ -0,0 +1,5 @@
+# Names of the meal plan engines. They live apart from meal_solver so the pages can show the engine choice without
+# importing NumPy.
+GREEDY_ENGINE = "greedy"
+KNAPSACK_ENGINE = "knapsack"
+ENGINES = [GREEDY_ENGINE, KNAPSACK_ENGINE]
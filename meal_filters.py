@@ -0,0 +1,81 @@
+import numpy as np
+
+from meal_catalog import catalog_path_of
+from meal_ingredients import build_ingredient_matrix, load_ingredient_matrix
+
+
+# Catalog columns that plans can be constrained on; "Ingredients" matches the ingredient names of a meal
+FILTER_COLUMNS = ["Sensitivity", "Meal Type", "Meal Category", "Ingredients"]
+
+# Bitsets built for the catalogs in use, keyed by id() of the DataFrame
+_bitset_cache = {}
+_BITSET_CACHE_SIZE = 4
+
+
+# Function to pack (value code, catalog row) hits into one bitset per value, setting the bits straight in the packed
+# arrays. Returns a (values x bytes) array.
+def _pack_hits(codes, rows, value_count, size):
+    row_bytes = (size + 7) // 8
+    packed = np.zeros(value_count * row_bytes, dtype=np.uint8)
+    np.bitwise_or.at(packed, codes.astype(np.int64) * row_bytes + (rows >> 3), (0x80 >> (rows & 7)).astype(np.uint8))
+    return packed.reshape(value_count, row_bytes)
+
+
+# Function to build a packed bitset (one bit per catalog row) for every value of the filter columns.
+# The ingredients come from the cached ingredient matrix of the catalog file when the DataFrame was loaded from one.
+def build_meal_bitsets(meals_df):
+    size = len(meals_df)
+    bitsets = {"size": size}
+    for column in FILTER_COLUMNS[:-1]:
+        codes, values = meals_df[column].astype(object).factorize()
+        rows = np.flatnonzero(codes >= 0)
+        bitsets[column] = dict(zip(values.tolist(), _pack_hits(codes[rows], rows, len(values), size)))
+
+    path = catalog_path_of(meals_df)
+    matrix = load_ingredient_matrix(path) if path is not None else build_ingredient_matrix(meals_df["Ingredients"])
+    # Ingredients with the same name in different units share one bitset
+    names, name_codes = np.unique(matrix["names"], return_inverse=True)
+    packed = _pack_hits(name_codes[matrix["indices"]], matrix["meal_rows"].astype(np.int64), len(names), size)
+    bitsets["Ingredients"] = dict(zip(names.tolist(), packed))
+    return bitsets
+
+
+# Function to get the bitsets of a catalog, building them only once per DataFrame
+def get_meal_bitsets(meals_df):
+    entry = _bitset_cache.get(id(meals_df))
+    # Keep a reference to the DataFrame so its id() cannot be reused while the entry is cached
+    if entry is not None and entry[0] is meals_df:
+        return entry[1]
+
+    bitsets = build_meal_bitsets(meals_df)
+    if len(_bitset_cache) >= _BITSET_CACHE_SIZE:
+        _bitset_cache.pop(next(iter(_bitset_cache)))
+    _bitset_cache[id(meals_df)] = (meals_df, bitsets)
+    return bitsets
+
+
+# Function to list the values of a filter column, for the include/exclude widgets
+def filter_values(meals_df, column):
+    return sorted(get_meal_bitsets(meals_df)[column])
+
+
+# Function to find the catalog rows allowed by include/exclude constraints, given as {column: [values]} dicts.
+# A row is allowed when, for every included column, it has one of the values, and it has none of the excluded values
+# of any column. Unknown values match no row, and a column given no values is no constraint (plan_cache.plan_key leaves
+# it out of the plan ID too). Returns a boolean mask over the catalog rows, or None without constraints.
+def constraint_mask(bitsets, include=None, exclude=None):
+    include = {column: values for column, values in (include or {}).items() if values}
+    exclude = {column: values for column, values in (exclude or {}).items() if values}
+    if not include and not exclude:
+        return None
+    empty = np.zeros((bitsets["size"] + 7) // 8, dtype=np.uint8)
+    allowed = ~empty
+    for column, values in include.items():
+        column_bits = empty
+        for value in values:
+            column_bits = column_bits | bitsets[column].get(value, empty)
+        allowed &= column_bits
+    for column, values in exclude.items():
+        for value in values:
+            allowed &= ~bitsets[column].get(value, empty)
+    return np.unpackbits(allowed, count=bitsets["size"]).astype(bool)
@@ -0,0 +1,75 @@
+import numpy as np
+
+
+# Macro columns that can be queried with a (min, max) range
+MACRO_COLUMNS = ["Protein (g)", "Carbohydrates (g)", "Fat (g)"]
+
+# Indexes built for the catalogs in use, keyed by id() of the DataFrame
+_index_cache = {}
+_INDEX_CACHE_SIZE = 4
+
+
+# Function to build a per-category index of the meals.
+# Each category keeps its meals sorted by calories in contiguous arrays, plus a sorted copy of every
+# macro column so that range queries are answered with binary search.
+def build_meal_index(meals_df):
+    calories = meals_df["Calories"].to_numpy(dtype=np.float64)
+    macros = {macro: meals_df[macro].to_numpy(dtype=np.float64) for macro in MACRO_COLUMNS}
+    # Same code for every row with the same meal name (the catalog lists some meals more than once)
+    meal_codes = meals_df["Meal Name"].factorize()[0]
+
+    meal_index = {}
+    for category, positions in meals_df.groupby("Category", observed=True, sort=False).indices.items():
+        rows = positions[np.argsort(calories[positions], kind="stable")]
+        group = {
+            "rows": np.ascontiguousarray(rows),
+            "Calories": np.ascontiguousarray(calories[rows]),
+            "Meal codes": np.ascontiguousarray(meal_codes[rows]),
+        }
+        for macro in MACRO_COLUMNS:
+            values = np.ascontiguousarray(macros[macro][rows])
+            order = np.argsort(values, kind="stable")
+            group[macro] = values
+            group[macro + " order"] = order
+            group[macro + " sorted"] = values[order]
+        meal_index[category] = group
+    return meal_index
+
+
+# Function to get the index of a catalog, building it only once per DataFrame
+def get_meal_index(meals_df):
+    entry = _index_cache.get(id(meals_df))
+    # Keep a reference to the DataFrame so its id() cannot be reused while the entry is cached
+    if entry is not None and entry[0] is meals_df:
+        return entry[1]
+
+    meal_index = build_meal_index(meals_df)
+    if len(_index_cache) >= _INDEX_CACHE_SIZE:
+        _index_cache.pop(next(iter(_index_cache)))
+    _index_cache[id(meals_df)] = (meals_df, meal_index)
+    return meal_index
+
+
+# Function to find the meals of a category whose macros fall inside the given ranges.
+# Returns positions into the category group (ascending calories); use group["rows"] to map them to catalog rows.
+def query_meal_index(meal_index, category, protein_range=None, carb_range=None, fat_range=None):
+    group = meal_index.get(category)
+    if group is None:
+        return np.empty(0, dtype=np.intp)
+
+    size = len(group["rows"])
+    mask = None
+    for macro, value_range in zip(MACRO_COLUMNS, (protein_range, carb_range, fat_range)):
+        if not value_range:
+            continue
+        sorted_values = group[macro + " sorted"]
+        start = np.searchsorted(sorted_values, value_range[0], side="left")
+        stop = np.searchsorted(sorted_values, value_range[1], side="right")
+        hits = np.zeros(size, dtype=bool)
+        hits[group[macro + " order"][start:stop]] = True
+        mask = hits if mask is None else mask & hits
+
+    if mask is None:
+        return np.arange(size)
+    return np.flatnonzero(mask)
+
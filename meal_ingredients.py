@@ -0,0 +1,121 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from meal_catalog import CATALOG_FILE, catalog_version, load_meal_catalog
+from meal_selection import CATALOG_ROW_KEY
+
+
+# One ingredient of the "Ingredients" text, e.g. "فول (200g)": name, amount and unit
+INGREDIENT_PATTERN = r"\s*([^,(]+?)\s*\(\s*(\d+(?:\.\d+)?)\s*([^)\d\s]*)\s*\)"
+
+# Arrays of the ingredient matrix saved in the on-disk cache
+MATRIX_ARRAYS = ["indptr", "indices", "amounts", "meal_rows", "names", "units"]
+
+# Parsed ingredient matrices for this process, keyed by absolute catalog path
+_matrix_cache = {}
+_matrix_lock = threading.Lock()
+
+
+# Function to parse the "Ingredients" texts of a catalog into a sparse meal x ingredient matrix in CSR form:
+# the ingredients of meal i are indices[indptr[i]:indptr[i + 1]] with the amounts at the same positions
+# (meal_rows holds the meal of every position).
+# An ingredient is a (name, unit) pair, so grams and millilitres are never added together.
+def build_ingredient_matrix(ingredients):
+    ingredients = pd.Series(ingredients, dtype="string").reset_index(drop=True)
+    parts = ingredients.str.extractall(INGREDIENT_PATTERN)
+    meal_rows = parts.index.get_level_values(0).to_numpy(dtype=np.intp)
+    codes, pairs = pd.MultiIndex.from_arrays([parts[0], parts[2]]).factorize()
+    return {
+        "indptr": np.concatenate([[0], np.cumsum(np.bincount(meal_rows, minlength=len(ingredients)))]).astype(np.int64),
+        "indices": codes.astype(np.int32),
+        "amounts": parts[1].to_numpy(dtype=np.float64),
+        "meal_rows": meal_rows,
+        "names": np.array(pairs.get_level_values(0).tolist(), dtype=str),
+        "units": np.array(pairs.get_level_values(1).tolist(), dtype=str),
+    }
+
+
+# Function to get the file the ingredient matrix of a catalog is cached in, next to the catalog
+def matrix_file(path=CATALOG_FILE):
+    return os.path.splitext(path)[0] + ".ingredients.npz"
+
+
+# Function to load the ingredient matrix of a catalog. It is read from the on-disk cache when that was built from the
+# same catalog version, and parsed (and the cache rewritten) otherwise.
+def load_ingredient_matrix(path=CATALOG_FILE):
+    key = os.path.abspath(path)
+    meals_df = load_meal_catalog(key)
+    version = catalog_version(key)
+    entry = _matrix_cache.get(key)
+    if entry is not None and entry["version"] == version:
+        return entry["matrix"]
+
+    with _matrix_lock:
+        entry = _matrix_cache.get(key)
+        if entry is not None and entry["version"] == version:
+            return entry["matrix"]
+
+        matrix = None
+        try:
+            with np.load(matrix_file(key)) as cached:
+                if str(cached["version"]) == version:
+                    matrix = {name: cached[name] for name in MATRIX_ARRAYS}
+        except (OSError, KeyError, ValueError):
+            pass
+        if matrix is None:
+            matrix = build_ingredient_matrix(meals_df["Ingredients"])
+            try:
+                # Write under a temporary name first, so other processes never read a half-written cache
+                with open(matrix_file(key) + ".tmp", mode='wb') as file:
+                    np.savez(file, version=version, **matrix)
+                os.replace(matrix_file(key) + ".tmp", matrix_file(key))
+            except OSError:
+                # The catalog directory is read-only; parse again next time
+                pass
+
+        # "Ingredients" column of the catalog, to check the catalog rows of the served meals
+        matrix["ingredients"] = meals_df["Ingredients"]
+        _matrix_cache[key] = {"version": version, "matrix": matrix}
+        return matrix
+
+
+# Function to count how often each catalog row is served, from the meal records of the served meals (by their catalog
+# row). Records without a catalog row, or whose row now holds other ingredients (plans stored before the catalog
+# changed), are returned separately as counts of their "Ingredients" texts.
+def count_meals(matrix, meals):
+    meals_df = pd.DataFrame(list(meals), columns=[CATALOG_ROW_KEY, "Ingredients"])
+    rows = meals_df[CATALOG_ROW_KEY].fillna(-1).to_numpy(dtype=np.intp)
+    texts = meals_df["Ingredients"].to_numpy(dtype=object)
+    known = (rows >= 0) & (rows < len(matrix["ingredients"]))
+    known[known] = matrix["ingredients"].take(rows[known]).to_numpy(dtype=object) == texts[known]
+    counts = np.bincount(rows[known], minlength=len(matrix["indptr"]) - 1).astype(np.float64)
+    return counts, pd.Series(texts[~known], dtype=object).value_counts()
+
+
+# Function to add up the amount of every ingredient for the given number of servings of each catalog row
+# (one sparse matrix-vector product)
+def ingredient_totals(matrix, counts):
+    return np.bincount(matrix["indices"], weights=matrix["amounts"] * counts[matrix["meal_rows"]], minlength=len(matrix["names"]))
+
+
+# Function to build the shopping list of the served meals, given by their meal records (e.g. every meal of the week
+# plans of many patients). Returns the total amount of every ingredient, largest first.
+def shopping_list(meals, path=CATALOG_FILE):
+    matrix = load_ingredient_matrix(path)
+    counts, unknown = count_meals(matrix, meals)
+    shopping_df = pd.DataFrame({"ingredient": matrix["names"], "unit": matrix["units"], "amount": ingredient_totals(matrix, counts)})
+
+    if len(unknown):
+        unknown_matrix = build_ingredient_matrix(unknown.index)
+        unknown_df = pd.DataFrame({
+            "ingredient": unknown_matrix["names"],
+            "unit": unknown_matrix["units"],
+            "amount": ingredient_totals(unknown_matrix, unknown.to_numpy(dtype=np.float64)),
+        })
+        shopping_df = pd.concat([shopping_df, unknown_df]).groupby(["ingredient", "unit"], as_index=False, sort=False)["amount"].sum()
+
+    shopping_df = shopping_df[shopping_df["amount"] > 0]
+    return shopping_df.sort_values("amount", ascending=False, kind="stable").reset_index(drop=True)
@@ -0,0 +1,120 @@
+import numpy as np
+
+from meal_filters import constraint_mask, get_meal_bitsets
+from meal_index import MACRO_COLUMNS, get_meal_index, query_meal_index
+from meal_selection import build_meal_records, greedy_select
+from meal_solver import DEFAULT_TIME_BUDGET, GREEDY_ENGINE, KNAPSACK_ENGINE, solve_day_meals
+from timings import timed, timer
+
+
+# Define the calorie distribution of a day between the meal categories
+MEAL_CATEGORIES = {
+    "الفطار": 0.20,
+    "الغداء": 0.40,
+    "العشاء": 0.30,
+    "السناكس": 0.10
+}
+
+
+# Function to generate the meal plans of several days at once.
+# The catalog is filtered and indexed once, and with the greedy engine the meal order of every day is drawn in
+# one pass. A meal served on one day is not served again for the next `variety_days` days.
+# `include` and `exclude` constrain the meals on the meal_filters.FILTER_COLUMNS, e.g. exclude={"Ingredients": ["فول"]}.
+# `time_budget` and `meal_budget` bound the knapsack engine per day (see meal_solver.solve_day_meals).
+# Returns one meal plan (category -> meal records) per day.
+@timed("plan generation")
+def generate_multi_day_plan(calorie_intake, meals_df, days=7, protein_range=None, carb_range=None, fat_range=None, engine=GREEDY_ENGINE, variety_days=0, rng=None, time_budget=DEFAULT_TIME_BUDGET, include=None, exclude=None, meal_budget=None):
+    if rng is None:
+        rng = np.random.default_rng()
+    meal_index = get_meal_index(meals_df)
+    with timer("plan filtering"):
+        category_positions = {
+            meal_category: query_meal_index(meal_index, meal_category, protein_range, carb_range, fat_range)
+            for meal_category in MEAL_CATEGORIES
+        }
+        allowed = constraint_mask(get_meal_bitsets(meals_df), include, exclude)
+        if allowed is not None:
+            for meal_category, positions in category_positions.items():
+                if positions.size:
+                    category_positions[meal_category] = positions[allowed[meal_index[meal_category]["rows"][positions]]]
+    if engine == GREEDY_ENGINE:
+        # Random order of the category meals for every day, drawn together
+        day_orders = {
+            meal_category: rng.random((days, len(positions))).argsort(axis=1)
+            for meal_category, positions in category_positions.items()
+        }
+
+    # Meal name code of every catalog row, and the day each meal (by name) was last served on
+    meal_codes = np.zeros(len(meals_df), dtype=np.intp)
+    for group in meal_index.values():
+        meal_codes[group["rows"]] = group["Meal codes"]
+    last_served = np.full(len(meals_df), -variety_days - 1)
+
+    multi_day_plan = []
+    with timer("plan selection"):
+        for day in range(days):
+            available = {}
+            for meal_category, positions in category_positions.items():
+                rows = meal_index[meal_category]["rows"][positions] if positions.size else positions
+                available[meal_category] = last_served[meal_codes[rows]] < day - variety_days
+
+            if engine == KNAPSACK_ENGINE:
+                day_rows = solve_day_meals(
+                    meal_index, MEAL_CATEGORIES, calorie_intake, protein_range, carb_range, fat_range, rng, time_budget,
+                    category_positions={meal_category: positions[available[meal_category]] for meal_category, positions in category_positions.items()},
+                    meal_budget=meal_budget,
+                )
+            else:
+                day_rows = {}
+                for meal_category, percentage in MEAL_CATEGORIES.items():
+                    positions = category_positions[meal_category]
+                    if not positions.size:
+                        day_rows[meal_category] = positions
+                        continue
+                    order = day_orders[meal_category][day]
+                    order = order[available[meal_category][order]]
+                    group = meal_index[meal_category]
+                    picked = greedy_select(group["Calories"][positions], calorie_intake * percentage, order=order)
+                    day_rows[meal_category] = group["rows"][positions[picked]]
+
+            meal_plan = {}
+            for meal_category, rows in day_rows.items():
+                last_served[meal_codes[rows]] = day
+                meal_plan[meal_category] = build_meal_records(meals_df, rows)
+            multi_day_plan.append(meal_plan)
+    return multi_day_plan
+
+
+# Function to add up the nutrients of a day meal plan
+def plan_nutrient_totals(meal_plan):
+    total_nutrients = {nutrient: 0 for nutrient in MACRO_COLUMNS}
+    for meals in meal_plan.values():
+        for meal_info in meals:
+            for nutrient in total_nutrients:
+                total_nutrients[nutrient] += meal_info[nutrient]
+    return total_nutrients
+
+
+# Function to list the nutrients of a day meal plan that are out of the specified ranges
+def out_of_range_nutrients(meal_plan, protein_range=None, carb_range=None, fat_range=None):
+    total_nutrients = plan_nutrient_totals(meal_plan)
+    out_of_range = []
+    for nutrient, value_range in zip(MACRO_COLUMNS, (protein_range, carb_range, fat_range)):
+        if value_range and not (value_range[0] <= total_nutrients[nutrient] <= value_range[1]):
+            out_of_range.append(nutrient)
+    return out_of_range
+
+
+# Function to score a multi-day plan, lower is better: for every day the relative calorie error plus, for every
+# macro out of its range, the distance to the range relative to its upper end
+def score_plan(multi_day_plan, calorie_intake, protein_range=None, carb_range=None, fat_range=None):
+    score = 0.0
+    for meal_plan in multi_day_plan:
+        calories = sum(meal_info["Calories"] for meals in meal_plan.values() for meal_info in meals)
+        score += abs(calories - calorie_intake) / max(calorie_intake, 1)
+        total_nutrients = plan_nutrient_totals(meal_plan)
+        for nutrient, value_range in zip(MACRO_COLUMNS, (protein_range, carb_range, fat_range)):
+            if value_range:
+                low, high = value_range
+                score += (max(0, low - total_nutrients[nutrient]) + max(0, total_nutrients[nutrient] - high)) / max(high, 1)
+    return score
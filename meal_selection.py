@@ -0,0 +1,60 @@
+import numpy as np
+
+
+# Keys of a meal record in a meal plan and the catalog columns they are read from. A record also keeps its position in
+# the catalog under CATALOG_ROW_KEY, so the served meals can be counted without matching their text.
+MEAL_RECORD_COLUMNS = {
+    "Meal": "Meal Name",
+    "Calories": "Calories",
+    "Ingredients": "Ingredients",
+    "Weight (g)": "Weight (g)",
+    "Protein (g)": "Protein (g)",
+    "Carbohydrates (g)": "Carbohydrates (g)",
+    "Fat (g)": "Fat (g)",
+    "Category": "Category",
+    "Meal Type": "Meal Type",
+}
+CATALOG_ROW_KEY = "Catalog Row"
+
+
+# Function to pick meals in random order, keeping each meal that still fits in the remaining calorie allowance.
+# Works on whole blocks at a time: every candidate after a rejection that is bigger than the remaining
+# allowance is dropped at once, and a running sum accepts the longest prefix of the rest that fits.
+# `order` gives the positions to try, in order; by default every meal is tried in a random order from `rng`.
+# Returns positions into `calories` in the order the meals were picked.
+def greedy_select(calories, calorie_allowance, rng=None, order=None):
+    calories = np.asarray(calories, dtype=np.float64)
+    if order is None:
+        if rng is None:
+            rng = np.random.default_rng()
+        order = rng.permutation(len(calories))
+    candidates = np.asarray(order, dtype=np.intp)
+    remaining = calorie_allowance
+    selected = []
+
+    while candidates.size:
+        candidates = candidates[calories[candidates] <= remaining]
+        if not candidates.size:
+            break
+        cumulative = np.cumsum(calories[candidates])
+        fits = int(np.searchsorted(cumulative, remaining, side="right"))
+        selected.append(candidates[:fits])
+        if fits == candidates.size:
+            break
+        # The next candidate does not fit in what is left, skip it and continue with the smaller allowance
+        remaining -= cumulative[fits - 1]
+        candidates = candidates[fits + 1:]
+
+    if not selected:
+        return np.empty(0, dtype=np.intp)
+    return np.concatenate(selected)
+
+
+# Function to build the meal records of the given catalog rows (positions in meals_df); only those rows are converted
+# to Python values
+def build_meal_records(meals_df, rows):
+    values = [meals_df[column].take(rows).tolist() for column in MEAL_RECORD_COLUMNS.values()]
+    records = [dict(zip(MEAL_RECORD_COLUMNS, meal_values)) for meal_values in zip(*values)]
+    for record, row in zip(records, np.asarray(rows).tolist()):
+        record[CATALOG_ROW_KEY] = row
+    return records
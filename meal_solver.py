@@ -0,0 +1,139 @@
+import time
+
+import numpy as np
+
+from meal_engines import ENGINES, GREEDY_ENGINE, KNAPSACK_ENGINE
+from meal_index import MACRO_COLUMNS, query_meal_index
+
+
+# Calories per step of the knapsack table, and the default time budget of a whole day plan (seconds)
+CALORIE_RESOLUTION = 5
+DEFAULT_TIME_BUDGET = 0.25
+
+# Meals the knapsack table takes in per second (measured on a 100k meal catalog), and the number of meals a whole day
+# plan may try for the default time budget. Unlike the time budget, a meal budget gives the same plan for the same
+# seed on any machine.
+MEALS_PER_SECOND = 20_000
+DEFAULT_MEAL_BUDGET = int(DEFAULT_TIME_BUDGET * MEALS_PER_SECOND)
+
+
+# Function to pick the meals that fill the calorie allowance as closely as possible (0/1 knapsack).
+# The table is indexed by calories in steps of CALORIE_RESOLUTION. A meal is only added to a table entry when the
+# macros of the entry stay within `macro_limits`; among entries with the same calories the one using the smallest
+# part of the limits is kept, leaving the most room for the next meals. Meals are tried in random order and the
+# table is valid after every meal, so when the deadline (a time.perf_counter() value) passes or `max_meals` meals
+# have been taken in, the best plan of the meals tried so far is returned. With `macro_minimums`, entries are first
+# ranked by how far their macros fall short of the minimums, and the fullest entry reaching them is returned (the
+# fullest entry when none does). Returns positions into `calories` of the picked meals.
+def knapsack_select(calories, macros, calorie_allowance, macro_limits, rng=None, deadline=None, max_meals=None, macro_minimums=None):
+    if rng is None:
+        rng = np.random.default_rng()
+    calories = np.asarray(calories, dtype=np.float64)
+    macro_limits = np.asarray(macro_limits, dtype=np.float64)
+    macros = np.asarray(macros, dtype=np.float64).reshape(len(calories), len(macro_limits))
+    # Macros without a limit do not count towards the score of an entry
+    macro_scale = np.where(np.isinf(macro_limits), np.inf, np.maximum(macro_limits, 1.0))
+    macro_minimums = np.zeros(len(macro_limits)) if macro_minimums is None else np.asarray(macro_minimums, dtype=np.float64)
+    minimum_scale = np.maximum(macro_minimums, 1.0)
+
+    capacity = int(calorie_allowance // CALORIE_RESOLUTION)
+    if capacity < 0 or not len(calories):
+        return np.empty(0, dtype=np.intp)
+    # Round meal calories up so that a full table never goes over the allowance
+    weights = np.ceil(calories / CALORIE_RESOLUTION)
+
+    reached = np.zeros(capacity + 1, dtype=bool)
+    reached[0] = True
+    macro_totals = np.zeros((capacity + 1, len(macro_limits)))
+    scores = np.zeros(capacity + 1)
+    shortfalls = np.full(capacity + 1, (macro_minimums / minimum_scale).sum())
+
+    tried = []
+    keep = []
+    taken_in = 0
+    for item in rng.permutation(len(calories)):
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+        weight = weights[item]
+        if not weight <= capacity or np.any(macros[item] > macro_limits):
+            continue
+        if max_meals is not None and taken_in >= max_meals:
+            break
+        taken_in += 1
+        weight = int(weight)
+
+        source = slice(0, capacity + 1 - weight)
+        target = slice(weight, capacity + 1)
+        new_totals = macro_totals[source] + macros[item]
+        new_scores = (new_totals / macro_scale).sum(axis=1)
+        new_shortfalls = (np.maximum(macro_minimums - new_totals, 0.0) / minimum_scale).sum(axis=1)
+        closer = (new_shortfalls < shortfalls[target]) | ((new_shortfalls == shortfalls[target]) & (new_scores < scores[target]))
+        better = reached[source] & np.all(new_totals <= macro_limits, axis=1) & (~reached[target] | closer)
+        if not better.any():
+            continue
+
+        kept = np.zeros(capacity + 1, dtype=bool)
+        kept[target] = better
+        reached[kept] = True
+        macro_totals[kept] = new_totals[better]
+        scores[kept] = new_scores[better]
+        shortfalls[kept] = new_shortfalls[better]
+        tried.append(item)
+        keep.append(kept)
+
+    # Walk back from the fullest reachable entry (reaching the macro minimums if one can) to recover the picked meals
+    reaching = reached & (shortfalls == 0)
+    remaining = int(np.flatnonzero(reaching if reaching.any() else reached)[-1])
+    picked = []
+    for item, kept in zip(reversed(tried), reversed(keep)):
+        if kept[remaining]:
+            picked.append(item)
+            remaining -= int(weights[item])
+    return np.array(picked[::-1], dtype=np.intp)
+
+
+# Function to pick the meals of a whole day with the knapsack engine.
+# Categories are solved in order; each gets its share of the macro budget the earlier categories left over,
+# so the day totals never go over the upper end of the ranges. What is still missing to the lower ends is shared out
+# the same way, and each category reaches its share when its candidates allow it; a day can still fall short of the
+# lower ends (the pages warn then). The time budget (seconds) and the meal budget (meals
+# tried) are split the same way; with no time budget the same rng seed always gives the same plan.
+# `category_positions` can give the candidate positions of each category group instead of querying the ranges.
+# Returns the catalog rows (positions in meals_df) of the picked meals for every category.
+def solve_day_meals(meal_index, meal_categories, calorie_intake, protein_range=None, carb_range=None, fat_range=None, rng=None, time_budget=DEFAULT_TIME_BUDGET, category_positions=None, meal_budget=None):
+    if rng is None:
+        rng = np.random.default_rng()
+    start = time.perf_counter()
+    macro_budget = np.array([value_range[1] if value_range else np.inf for value_range in (protein_range, carb_range, fat_range)], dtype=np.float64)
+    macro_shortfall = np.array([value_range[0] if value_range else 0.0 for value_range in (protein_range, carb_range, fat_range)], dtype=np.float64)
+    remaining_share = sum(meal_categories.values())
+    elapsed_share = 0.0
+
+    day_rows = {}
+    for meal_category, percentage in meal_categories.items():
+        elapsed_share += percentage
+        deadline = start + time_budget * elapsed_share / sum(meal_categories.values()) if time_budget is not None else None
+        if category_positions is not None:
+            positions = category_positions[meal_category]
+        else:
+            positions = query_meal_index(meal_index, meal_category, protein_range, carb_range, fat_range)
+        if not positions.size:
+            day_rows[meal_category] = positions
+            remaining_share -= percentage
+            continue
+
+        group = meal_index[meal_category]
+        macros = np.column_stack([group[macro][positions] for macro in MACRO_COLUMNS])
+        macro_limits = macro_budget * (percentage / remaining_share)
+        max_meals = max(1, int(meal_budget * percentage / sum(meal_categories.values()))) if meal_budget is not None else None
+        macro_minimums = np.maximum(macro_shortfall, 0.0) * (percentage / remaining_share)
+        picked = knapsack_select(
+            group["Calories"][positions], macros, calorie_intake * percentage, macro_limits, rng, deadline, max_meals,
+            macro_minimums if macro_minimums.any() else None
+        )
+
+        macro_budget = macro_budget - macros[picked].sum(axis=0)
+        macro_shortfall = macro_shortfall - macros[picked].sum(axis=0)
+        remaining_share -= percentage
+        day_rows[meal_category] = group["rows"][positions[picked]]
+    return day_rows
@@ -1,57 +1,52 @@
 import streamlit as st
-import pandas as pd
-
-# Define the file path for storing patient data
-DATA_FILE = "patient_data.csv"
-
-# Function to read patient data
-def read_patient_data():
-    try:
-        patient_df = pd.read_csv(DATA_FILE)
-        return patient_df
-    except FileNotFoundError:
-        st.error("Patient data file not found.")
-        return None
-
-def calculate_change(df, column):
-    return df[column].diff().fillna(0)
+
 def patient_data_page():
     st.title("Patient Data Analysis")
 
-    # Read patient data
-    patient_df = read_patient_data()
+    # The analysis modules pull in pandas and NumPy; import them once the title is drawn
+    from chart_data import build_chart_frame, chart_window
+    from patient_metrics import calculate_patient_metrics
+    from patient_history import CHANGE_COLUMNS, load_patient_history, read_patient_names, sync_patient_history
+
+    # Append newly saved visits to the per-patient history partitions, then read the patient names from the roster
+    sync_patient_history()
+    patient_names = read_patient_names()
 
-    if patient_df is not None:
+    if not patient_names:
+        st.error("No patient data saved yet.")
+    else:
         # Display dropdown menu with patient names
-        selected_patient = st.selectbox("Select a patient", patient_df["patient_name"].unique())
+        selected_patient = st.selectbox("Select a patient", patient_names)
+
+        # Load the partition of the selected patient only (with the changes in weight, body fat percentage, and lean body
+        # mass already calculated), then calculate BMI, ideal weight, BMR and TBW for every visit in one pass
+        filtered_patient_data = calculate_patient_metrics(load_patient_history(selected_patient))
 
-        # Filter patient data based on selected patient
-        filtered_patient_data = patient_df[patient_df["patient_name"] == selected_patient]
+        # Index the chart columns by visit time once, for all the charts
+        progression_columns = CHANGE_COLUMNS
+        change_columns = [column + "_change" for column in CHANGE_COLUMNS]
+        chart_df = build_chart_frame(filtered_patient_data, progression_columns + change_columns)
+
+        # Select the date range to show; long histories are reduced to a few hundred points per chart
+        first_date, last_date = chart_df.index[0].date(), chart_df.index[-1].date()
+        date_range = st.date_input("Date range", value=(first_date, last_date), min_value=first_date, max_value=last_date)
+        start, end = (date_range[0], date_range[-1]) if len(date_range) == 2 else (date_range[0], None)
 
         # Display patient data
         st.write("### Patient Data Overview")
-        st.dataframe(filtered_patient_data)
+        st.dataframe(filtered_patient_data.drop(columns=["id"] + change_columns))
 
         # Display weight progression chart
         st.write("### Weight Progression Over Time")
-        weight_chart_data = filtered_patient_data.set_index("datetime")[["weight", "body_fat_percentage", "lean_body_mass"]]
-        st.line_chart(weight_chart_data, use_container_width=True)
-
-        # Calculate changes in weight, body fat percentage, and lean body mass
-        filtered_patient_data["weight_change"] = calculate_change(filtered_patient_data, "weight")
-        filtered_patient_data["body_fat_percentage_change"] = calculate_change(filtered_patient_data, "body_fat_percentage")
-        filtered_patient_data["lean_body_mass_change"] = calculate_change(filtered_patient_data, "lean_body_mass")
+        st.line_chart(chart_window(chart_df, progression_columns, start, end), use_container_width=True)
 
-        
         # Display weight, body fat percentage, and lean body mass progression chart
         st.write("### Changes in Weight, Body Fat Percentage, and Lean Body Mass Over Time")
-        chart_data = filtered_patient_data.set_index("datetime")[["weight_change", "body_fat_percentage_change", "lean_body_mass_change"]]
-        st.line_chart(chart_data, use_container_width=True)
+        st.line_chart(chart_window(chart_df, change_columns, start, end), use_container_width=True)
 
         # Display change in weight
         st.write("### Change in Weight Over Time")
-        weight_change_data = filtered_patient_data.set_index("datetime")["weight_change"]
-        st.line_chart(weight_change_data, use_container_width=True)
+        st.line_chart(chart_window(chart_df, ["weight_change"], start, end), use_container_width=True)
 
         # Display the most recent change in weight in a box
         latest_weight_change = filtered_patient_data["weight_change"].iloc[-1]
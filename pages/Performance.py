@@ -0,0 +1,43 @@
+import json
+import os
+
+import pandas as pd
+import streamlit as st
+from timings import enable_timings, reset_timings, timings_enabled, timings_prometheus, timings_snapshot
+
+# The page is only shown when the server runs with AIMEAL_ADMIN=1: its settings apply to every session of the server
+ADMIN_ENABLED = os.environ.get("AIMEAL_ADMIN", "") not in ("", "0")
+
+def performance_page():
+    st.title("Performance")
+    if not ADMIN_ENABLED:
+        st.error("This page is only available when the server runs with AIMEAL_ADMIN=1.")
+        st.stop()
+
+    # Timings are off unless the server runs with AIMEAL_TIMINGS=1 or they are turned on here.
+    # They are shared by every session of this server process.
+    enabled = st.toggle("Record timings", value=timings_enabled())
+    if enabled != timings_enabled():
+        enable_timings(enabled)
+
+    snapshot = timings_snapshot()
+    if not snapshot["timings"] and not snapshot["counters"]:
+        st.info("No timings recorded yet.")
+    else:
+        # Slowest total first, in milliseconds
+        timings_df = pd.DataFrame.from_dict(snapshot["timings"], orient="index")
+        timings_df[["total", "mean", "max"]] *= 1000
+        timings_df = timings_df.rename(columns={"total": "total (ms)", "mean": "mean (ms)", "max": "max (ms)"})
+        st.dataframe(timings_df.sort_values("total (ms)", ascending=False), use_container_width=True)
+        if snapshot["counters"]:
+            st.dataframe(pd.Series(snapshot["counters"], name="count"), use_container_width=True)
+
+    st.download_button("Download Prometheus metrics", timings_prometheus(), file_name="aimeal_timings.prom", mime="text/plain")
+    st.download_button("Download JSON", json.dumps(snapshot, ensure_ascii=False, indent=2), file_name="aimeal_timings.json", mime="application/json")
+    if st.button("Reset timings"):
+        reset_timings()
+        st.rerun()
+
+
+if __name__ == "__main__":
+    performance_page()
@@ -0,0 +1,189 @@
+import contextlib
+import hashlib
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+import pandas as pd
+
+from patient_store import DATABASE_FILE, read_last_visit_id, read_patient_visits
+from timings import timed
+
+
+# Define the directory of the per-patient history partitions and of their roster index
+HISTORY_DIRECTORY = "patient_history"
+ROSTER_FILE = "roster.json"
+LOCK_FILE = "sync.lock"
+
+# Columns whose change between visits is shown on the analysis page
+CHANGE_COLUMNS = ["weight", "body_fat_percentage", "lean_body_mass"]
+
+# Columns of a partition and their NumPy types; every column is its own memory-mapped .npy file
+PARTITION_COLUMNS = {
+    "id": np.int64,
+    "age": np.float64,
+    "gender": str,
+    "weight": np.float64,
+    "height": np.float64,
+    "body_fat_percentage": np.float64,
+    "waist_to_hip_ratio": np.float64,
+    "lean_body_mass": np.float64,
+    "datetime": str,
+}
+PARTITION_COLUMNS.update({column + "_change": np.float64 for column in CHANGE_COLUMNS})
+
+_roster_cache = {}
+_sync_lock = threading.Lock()
+
+
+# Function to calculate the change of each column from the previous visit.
+# `previous` holds the last already stored visit (or None), so new visits can be appended to a stored history.
+def calculate_changes(visits_df, previous=None):
+    changes = {}
+    for column in CHANGE_COLUMNS:
+        previous_values = visits_df[column].shift(1)
+        if previous is not None and len(visits_df):
+            previous_values.iloc[0] = previous[column]
+        changes[column + "_change"] = (visits_df[column] - previous_values).fillna(0)
+    return changes
+
+
+# Function to read the roster index: the id of the last stored visit and, for every patient, the partition
+# directory and the number of stored visits. Re-read only when the file changes.
+def read_patient_roster(directory=HISTORY_DIRECTORY):
+    roster_path = os.path.abspath(os.path.join(directory, ROSTER_FILE))
+    try:
+        stat = os.stat(roster_path)
+    except FileNotFoundError:
+        return {"last_id": 0, "patients": {}}
+
+    signature = (stat.st_mtime_ns, stat.st_size)
+    entry = _roster_cache.get(roster_path)
+    if entry is None or entry["signature"] != signature:
+        with open(roster_path, mode='r', encoding='utf-8') as file:
+            entry = {"signature": signature, "roster": json.load(file)}
+        _roster_cache[roster_path] = entry
+    return entry["roster"]
+
+
+# Function to get the file of a partition column holding the given number of visits
+def _column_file(directory, partition, column, visits):
+    return os.path.join(directory, partition, f"{column}.{visits}.npy")
+
+
+# Function to write the roster index, replacing the old one in one step
+def _write_roster(directory, roster):
+    roster_path = os.path.join(directory, ROSTER_FILE)
+    with open(roster_path + ".tmp", mode='w', encoding='utf-8') as file:
+        json.dump(roster, file, ensure_ascii=False)
+    os.replace(roster_path + ".tmp", roster_path)
+
+
+# Function to hold the sync lock of a history directory, shared by every process syncing it
+@contextlib.contextmanager
+def _history_lock(directory):
+    with _sync_lock, open(os.path.join(directory, LOCK_FILE), mode='a+b') as file:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# Function to append the visits saved since the last sync to the patient partitions.
+# Column files are written under new names (suffixed with the visit count) and only become visible when the roster
+# is replaced, so readers never see a half-written partition. Syncs are serialized by a lock file in the directory;
+# the database is only read, so saving visits is never blocked by a sync. Returns the up-to-date roster.
+@timed("patient history sync")
+def sync_patient_history(path=DATABASE_FILE, directory=HISTORY_DIRECTORY):
+    roster = read_patient_roster(directory)
+    if read_last_visit_id(path) <= roster["last_id"]:
+        return roster
+
+    os.makedirs(directory, exist_ok=True)
+    with _history_lock(directory):
+        roster = read_patient_roster(directory)
+        new_visits = read_patient_visits(roster["last_id"], path=path)
+        if new_visits.empty:
+            return roster
+
+        roster = {"last_id": roster["last_id"], "patients": dict(roster["patients"])}
+        updated = {}
+        for patient_name, visits in new_visits.groupby("patient_name", sort=False):
+            entry = roster["patients"].get(patient_name)
+            if entry is None:
+                entry = {"partition": hashlib.sha1(patient_name.encode("utf-8")).hexdigest()[:16], "visits": 0}
+                os.makedirs(os.path.join(directory, entry["partition"]), exist_ok=True)
+                stored = None
+            else:
+                stored = {column: np.load(_column_file(directory, entry["partition"], column, entry["visits"]), mmap_mode="r") for column in PARTITION_COLUMNS}
+
+            previous = {column: stored[column][-1] for column in CHANGE_COLUMNS} if stored is not None else None
+            visits = visits.assign(**calculate_changes(visits, previous))
+            total = entry["visits"] + len(visits)
+            for column, dtype in PARTITION_COLUMNS.items():
+                values = visits[column].to_numpy(dtype=dtype if dtype is not str else object).astype(dtype)
+                if stored is not None:
+                    values = np.concatenate([stored[column], values])
+                np.save(_column_file(directory, entry["partition"], column, total), values)
+            roster["patients"][patient_name] = {"partition": entry["partition"], "visits": total}
+            updated[entry["partition"]] = total
+
+        roster["last_id"] = int(new_visits["id"].iloc[-1])
+        _write_roster(directory, roster)
+
+        # Remove the replaced column files. A file still mapped by another session cannot be removed on Windows;
+        # it is left for the next sync of that patient.
+        for partition, total in updated.items():
+            for file_name in os.listdir(os.path.join(directory, partition)):
+                if file_name.split(".")[-2] != str(total):
+                    try:
+                        os.remove(os.path.join(directory, partition, file_name))
+                    except OSError:
+                        pass
+    return roster
+
+
+# Function to list the patients with a stored history, for the patient dropdown
+def read_patient_names(directory=HISTORY_DIRECTORY):
+    return sorted(read_patient_roster(directory)["patients"])
+
+
+# Function to load the visit history of a patient, with the change columns, from its partition only.
+# A sync removes the replaced column files right after writing the new roster, so when a file of the roster read here
+# is already gone the roster is read again and the newer files are loaded.
+@timed("patient history load")
+def load_patient_history(patient_name, directory=HISTORY_DIRECTORY):
+    entry = read_patient_roster(directory)["patients"].get(patient_name)
+    while True:
+        if entry is None:
+            return pd.DataFrame(columns=list(PARTITION_COLUMNS))
+        try:
+            columns = {
+                column: np.load(_column_file(directory, entry["partition"], column, entry["visits"]), mmap_mode="r")
+                for column in PARTITION_COLUMNS
+            }
+            break
+        except FileNotFoundError:
+            latest = read_patient_roster(directory)["patients"].get(patient_name)
+            if latest == entry:
+                raise
+            entry = latest
+    history_df = pd.DataFrame(columns)
+    history_df.insert(0, "patient_name", patient_name)
+    return history_df
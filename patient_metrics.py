@@ -0,0 +1,97 @@
+import numpy as np
+
+from body_metrics import ACTIVITY_FACTORS, GOAL_OFFSETS
+
+
+# Array versions of the body_metrics functions. They take NumPy arrays or pandas columns and calculate a metric for
+# every row in one pass; rows with a gender other than "Male"/"Female" (or an unknown activity level) get NaN where the
+# scalar functions return None.
+
+
+# Function to pick a value per row by gender
+def _by_gender(gender, male_value, female_value):
+    gender = np.asarray(gender)
+    return np.select([gender == "Male", gender == "Female"], [male_value, female_value], np.nan)
+
+
+def calculate_bmi(weight, height):
+    weight = np.asarray(weight, dtype=np.float64)
+    height = np.asarray(height, dtype=np.float64)
+    return weight / ((height / 100) ** 2)
+
+
+def calculate_ideal_weight(height, gender):
+    height = np.asarray(height, dtype=np.float64)
+    return _by_gender(gender, 50.0, 45.5) + 0.91 * (height - 152.4)
+
+
+def calculate_bmr(weight, height, age, gender):
+    weight = np.asarray(weight, dtype=np.float64)
+    height = np.asarray(height, dtype=np.float64)
+    age = np.asarray(age, dtype=np.float64)
+    return 10 * weight + 6.25 * height - 5 * age + _by_gender(gender, 5.0, -161.0)
+
+
+def calculate_tdee(bmr, activity_level):
+    # Look the factors up once per distinct activity level instead of once per row
+    levels, inverse = np.unique(np.asarray(activity_level, dtype=object).astype(str), return_inverse=True)
+    factors = np.array([ACTIVITY_FACTORS.get(level, np.nan) for level in levels])
+    return np.asarray(bmr, dtype=np.float64) * factors[inverse.reshape(np.shape(activity_level))]
+
+
+# Function to calculate the calorie intake of every row for one list of weight goals
+def calculate_calorie_intake(tdee, goals, weight, ideal_weight):
+    goals = set(goals)
+    tdee, weight, ideal_weight = np.broadcast_arrays(
+        np.asarray(tdee, dtype=np.float64), np.asarray(weight, dtype=np.float64), np.asarray(ideal_weight, dtype=np.float64)
+    )
+    has_goal = {goal: np.full(tdee.shape, goal in goals) for goal in GOAL_OFFSETS}
+    if "Fitness" in goals:
+        has_goal["Weight gain"] = has_goal["Weight gain"] | (weight < ideal_weight)
+        has_goal["Weight loss"] = has_goal["Weight loss"] | (weight > ideal_weight)
+    return tdee + np.select(list(has_goal.values()), list(GOAL_OFFSETS.values()), 0)
+
+
+def calculate_tbw(weight, height, age, gender):
+    weight = np.asarray(weight, dtype=np.float64)
+    height = np.asarray(height, dtype=np.float64)
+    age = np.asarray(age, dtype=np.float64)
+    k = _by_gender(
+        gender,
+        2.447 - 0.09516 * age + 0.1074 * height + 0.3362 * weight,
+        -2.097 + 0.1069 * height + 0.2466 * weight
+    )
+    return 0.3669 * k - 0.0906 * weight + 0.1074 * height + 0.2466 * weight
+
+
+# Function to calculate every metric for a whole patient table (patient_data.csv schema).
+# TDEE is added when an activity level is given, either as a single level or as a column name of the table.
+# Returns a copy of the table with the metric columns added.
+def calculate_patient_metrics(patient_df, activity_level=None):
+    weight = patient_df["weight"].to_numpy(dtype=np.float64)
+    height = patient_df["height"].to_numpy(dtype=np.float64)
+    age = patient_df["age"].to_numpy(dtype=np.float64)
+    gender = patient_df["gender"].to_numpy(dtype=object)
+
+    bmr = calculate_bmr(weight, height, age, gender)
+    metrics = {
+        "bmi": calculate_bmi(weight, height),
+        "ideal_weight": calculate_ideal_weight(height, gender),
+        "bmr": bmr,
+        "tbw": calculate_tbw(weight, height, age, gender),
+    }
+    if activity_level is not None:
+        if activity_level in patient_df.columns:
+            activity_level = patient_df[activity_level].to_numpy(dtype=object)
+        else:
+            activity_level = np.full(len(patient_df), activity_level, dtype=object)
+        metrics["tdee"] = calculate_tdee(bmr, activity_level)
+    return patient_df.assign(**metrics)
+
+
+# Function to calculate the calorie intake over a grid of weights, heights and ages, for "what if" views. The three are
+# broadcast against each other, e.g. the intake for every weight from 60 to 120 kg:
+#   calorie_intake_grid(np.arange(60, 121), 175, 30, "Male", "Sedentary", ["Weight loss"])
+def calorie_intake_grid(weight, height, age, gender, activity_level, goals):
+    bmr = calculate_bmr(weight, height, age, gender)
+    return calculate_calorie_intake(bmr * ACTIVITY_FACTORS[activity_level], goals, weight, calculate_ideal_weight(height, gender))
@@ -0,0 +1,197 @@
+import csv
+import datetime
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+
+import pandas as pd
+
+from timings import timed
+
+
+# Define the file paths of the patient database and of the CSV file it replaces
+DATABASE_FILE = "patient_data.db"
+CSV_FILE = "patient_data.csv"
+
+# Columns of a saved patient visit, in the order of the patient_data.csv header
+PATIENT_FIELDS = ["patient_name", "age", "gender", "weight", "height", "body_fat_percentage", "waist_to_hip_ratio", "lean_body_mass", "datetime"]
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS patients (
+    id INTEGER PRIMARY KEY,
+    patient_name TEXT,
+    age INTEGER,
+    gender TEXT,
+    weight REAL,
+    height REAL,
+    body_fat_percentage REAL,
+    waist_to_hip_ratio REAL,
+    lean_body_mass REAL,
+    datetime TEXT
+)
+"""
+CREATE_INDEX = "CREATE INDEX IF NOT EXISTS patients_name_datetime ON patients (patient_name, datetime)"
+INSERT_PATIENT = f"INSERT INTO patients ({', '.join(PATIENT_FIELDS)}) VALUES ({', '.join('?' * len(PATIENT_FIELDS))})"
+
+# One connection per thread and database file; Streamlit runs every session in its own thread
+_local = threading.local()
+
+# Queue of the saves waiting for the writer thread, and the most saves committed in one transaction
+_write_queue = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+WRITE_BATCH_SIZE = 500
+
+
+# Function to get the connection of this thread, creating the database (and migrating the CSV file) on first use
+def get_connection(path=DATABASE_FILE):
+    path = os.path.abspath(path)
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    if path in connections:
+        return connections[path]
+
+    is_new = not os.path.exists(path)
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    with connection:
+        connection.execute(CREATE_TABLE)
+        connection.execute(CREATE_INDEX)
+    connections[path] = connection
+
+    # A new default database starts with the visits of the existing CSV file
+    if is_new and path == os.path.abspath(DATABASE_FILE) and os.path.exists(CSV_FILE):
+        migrate_csv(CSV_FILE, path)
+    return connection
+
+
+# Function to copy the visits of a patient_data.csv file into the database.
+# Only runs when the database has no visits yet, so calling it again does not duplicate them.
+def migrate_csv(csv_path=CSV_FILE, path=DATABASE_FILE):
+    with open(csv_path, mode='r', newline='', encoding='utf-8') as file:
+        rows = [[row.get(field) for field in PATIENT_FIELDS] for row in csv.DictReader(file)]
+
+    connection = get_connection(path)
+    with connection:
+        # Take the write lock before checking, so two processes starting together cannot both migrate
+        connection.execute("BEGIN IMMEDIATE")
+        if connection.execute("SELECT EXISTS (SELECT 1 FROM patients)").fetchone()[0]:
+            return 0
+        connection.executemany(INSERT_PATIENT, rows)
+    return len(rows)
+
+
+# Function to save patient data.
+# Saves from every session go through one writer thread, which commits all the saves waiting in its queue in a
+# single transaction. With wait=True (the default) the call returns once the visit is committed.
+@timed("patient save")
+def save_patient_data(patient_data, path=DATABASE_FILE, wait=True):
+    # Add current date and time to the patient data
+    patient_data["datetime"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current date and time
+    write = {"path": os.path.abspath(path), "row": [patient_data.get(field) for field in PATIENT_FIELDS], "done": threading.Event(), "error": None}
+    _start_writer()
+    _write_queue.put(write)
+    if wait:
+        write["done"].wait()
+        if write["error"] is not None:
+            raise write["error"]
+
+
+# Function to wait until every save queued so far is committed
+def flush_patient_writes():
+    if _writer is None:
+        return
+    write = {"path": None, "row": None, "done": threading.Event(), "error": None}
+    _start_writer()
+    _write_queue.put(write)
+    write["done"].wait()
+
+
+# Function to start the writer thread if it is not running
+def _start_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_write_patients, name="patient-writer", daemon=True)
+            _writer.start()
+
+
+# Function run by the writer thread: commits the queued saves in groups
+def _write_patients():
+    while True:
+        batch = [_write_queue.get()]
+        # Everything queued while the previous group was committing goes into this group
+        while len(batch) < WRITE_BATCH_SIZE:
+            try:
+                batch.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        rows_by_path = {}
+        for write in batch:
+            if write["path"] is not None:
+                rows_by_path.setdefault(write["path"], []).append(write["row"])
+        errors = {}
+        for path, rows in rows_by_path.items():
+            try:
+                connection = get_connection(path)
+                with connection:
+                    # Other processes write to the same file, take the write lock up front
+                    connection.execute("BEGIN IMMEDIATE")
+                    connection.executemany(INSERT_PATIENT, rows)
+            except Exception as error:
+                errors[path] = error
+
+        for write in batch:
+            write["error"] = errors.get(write["path"])
+            write["done"].set()
+
+
+# Function to read patient data, for one patient (an indexed lookup) or for all of them
+@timed("patient database read")
+def read_patient_data(patient_name=None, path=DATABASE_FILE):
+    columns = ", ".join(PATIENT_FIELDS)
+    connection = get_connection(path)
+    if patient_name is None:
+        return pd.read_sql_query(f"SELECT {columns} FROM patients ORDER BY id", connection)
+    return pd.read_sql_query(
+        f"SELECT {columns} FROM patients WHERE patient_name = ? ORDER BY datetime, id", connection, params=(patient_name,)
+    )
+
+
+# Function to read the visits saved after the visit with id `after_id`, for one patient or for all of them,
+# in the order they were saved
+@timed("patient database read")
+def read_patient_visits(after_id=0, patient_name=None, path=DATABASE_FILE):
+    columns = ", ".join(["id"] + PATIENT_FIELDS)
+    connection = get_connection(path)
+    if patient_name is None:
+        return pd.read_sql_query(f"SELECT {columns} FROM patients WHERE id > ? ORDER BY id", connection, params=(after_id,))
+    return pd.read_sql_query(
+        f"SELECT {columns} FROM patients WHERE patient_name = ? AND id > ? ORDER BY id", connection, params=(patient_name, after_id)
+    )
+
+
+# Function to get the id of the last saved visit
+def read_last_visit_id(path=DATABASE_FILE):
+    return get_connection(path).execute("SELECT COALESCE(MAX(id), 0) FROM patients").fetchone()[0]
+
+
+# Function to read the names of the saved patients
+def read_patient_names(path=DATABASE_FILE):
+    rows = get_connection(path).execute("SELECT DISTINCT patient_name FROM patients ORDER BY patient_name").fetchall()
+    return [row[0] for row in rows]
+
+
+# Commit the saves made with wait=False before the process exits
+atexit.register(flush_patient_writes)
+
+
+if __name__ == "__main__":
+    # One-shot migration of an existing patient_data.csv file
+    migrate_csv()
+    print(f"{len(read_patient_data())} visits in {DATABASE_FILE}")
@@ -0,0 +1,283 @@
+import argparse
+import asyncio
+import contextlib
+import math
+
+import pandas as pd
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from body_metrics import ACTIVITY_FACTORS, calculate_calorie_intake, calculate_metrics
+from meal_catalog import CATALOG_FILE, load_meal_catalog
+from meal_filters import FILTER_COLUMNS, get_meal_bitsets
+from meal_index import get_meal_index
+from meal_ingredients import load_ingredient_matrix
+from meal_planner import out_of_range_nutrients
+from meal_solver import ENGINES
+from patient_metrics import calculate_patient_metrics
+from plan_cache import PLAN_OPTIONS, generate_plans, load_plan
+from plan_export import EXPORT_FORMATS, MEDIA_TYPES, export_chunks, stored_plan_days
+from timings import timings_prometheus, timings_snapshot
+
+
+# HTTP/JSON service for the metrics and the meal plans, without the Streamlit UI. Run it with
+#   python plan_api.py --workers 4
+# or with uvicorn directly: uvicorn plan_api:app --workers 4
+
+# Requests arriving within BATCH_WINDOW seconds of each other are answered together, up to BATCH_SIZE at a time
+BATCH_WINDOW = 0.002
+BATCH_SIZE = 64
+
+# Most days of one plan request
+MAX_DAYS = 28
+
+# Largest calorie intake of a plan request (kcal/day); the knapsack table grows with it
+MAX_CALORIE_INTAKE = 10000
+
+
+# Function to make a batcher: an async function that queues one item and returns its result. The queued items are
+# handed to `function` (run in a worker thread) as one list, which must return one result per item. A result that is
+# an exception is raised for its item only.
+def make_batcher(function, window=BATCH_WINDOW, size=BATCH_SIZE):
+    pending = []
+
+    async def flush():
+        batch = pending[:size]
+        del pending[:size]
+        if not batch:
+            return
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(None, function, [item for item, future in batch])
+        except Exception as error:
+            for item, future in batch:
+                future.set_exception(error)
+            return
+        for (item, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def submit(item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending.append((item, future))
+        if len(pending) >= size:
+            loop.create_task(flush())
+        elif len(pending) == 1:
+            loop.call_later(window, lambda: loop.create_task(flush()))
+        return await future
+
+    return submit
+
+
+# Function to read the patient fields of a request body
+def read_patient(body):
+    try:
+        patient = {
+            "age": float(body["age"]),
+            "gender": str(body["gender"]),
+            "weight": float(body["weight"]),
+            "height": float(body["height"]),
+            "activity_level": str(body.get("activity_level", "Sedentary")),
+            "goals": body.get("goals", ["Maintenance"]),
+        }
+    except KeyError as error:
+        raise ValueError(f"missing field {error.args[0]}")
+    except (TypeError, ValueError):
+        raise ValueError("age, weight and height must be numbers")
+    if not isinstance(patient["goals"], list) or not all(isinstance(goal, str) for goal in patient["goals"]):
+        raise ValueError("goals must be a list of strings")
+    if not all(math.isfinite(patient[field]) for field in ("age", "weight", "height")):
+        raise ValueError("age, weight and height must be finite numbers")
+    if patient["activity_level"] not in ACTIVITY_FACTORS:
+        raise ValueError(f"activity_level must be one of {', '.join(ACTIVITY_FACTORS)}")
+    return patient
+
+
+# Function to check that a JSON value is a whole number (true and false are ints in Python, but not here)
+def _is_whole_number(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+# Function to read the plan options of a request body; the calorie intake is given or calculated from the patient fields
+def read_plan_request(body):
+    if "calorie_intake" in body:
+        if isinstance(body["calorie_intake"], bool):
+            raise ValueError("calorie_intake must be a number")
+        try:
+            plan_request = {"calorie_intake": float(body["calorie_intake"])}
+        except (TypeError, ValueError):
+            raise ValueError("calorie_intake must be a number")
+    else:
+        patient = read_patient(body)
+        if patient["gender"] not in ("Male", "Female"):
+            raise ValueError("calorie_intake is required for a gender other than Male or Female")
+        plan_request = {"calorie_intake": calculate_metrics(**patient)["calorie_intake"]}
+    if not 0 < plan_request["calorie_intake"] <= MAX_CALORIE_INTAKE:
+        raise ValueError(f"calorie_intake must be above 0 and at most {MAX_CALORIE_INTAKE}")
+
+    for option, default in PLAN_OPTIONS.items():
+        plan_request[option] = body.get(option, default)
+    if not _is_whole_number(plan_request["days"]) or not 1 <= plan_request["days"] <= MAX_DAYS:
+        raise ValueError(f"days must be a whole number from 1 to {MAX_DAYS}")
+    if plan_request["engine"] not in ENGINES:
+        raise ValueError(f"engine must be one of {', '.join(ENGINES)}")
+    if not _is_whole_number(plan_request["variety_days"]) or plan_request["variety_days"] < 0:
+        raise ValueError("variety_days must be a whole number")
+    if plan_request["seed"] is not None and (not _is_whole_number(plan_request["seed"]) or not 0 <= plan_request["seed"] < 2 ** 63):
+        raise ValueError("seed must be a whole number from 0 to 2**63 - 1")
+    for option in ("protein_range", "carb_range", "fat_range"):
+        value_range = plan_request[option]
+        if value_range is not None and (not isinstance(value_range, list) or len(value_range) != 2 or not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in value_range)):
+            raise ValueError(f"{option} must be a [min, max] pair")
+    for option in ("include", "exclude"):
+        constraints = plan_request[option]
+        if constraints is not None and (
+            not isinstance(constraints, dict)
+            or not all(
+                column in FILTER_COLUMNS and isinstance(values, list) and values and all(isinstance(value, str) for value in values)
+                for column, values in constraints.items()
+            )
+        ):
+            raise ValueError(f"{option} must map some of {', '.join(FILTER_COLUMNS)} to non-empty lists of strings")
+    return plan_request
+
+
+# Function to calculate the metrics of a batch of patients in one vectorized pass
+def calculate_batch_metrics(patients):
+    patient_df = calculate_patient_metrics(pd.DataFrame(patients), "activity_level")
+    results = []
+    for patient in patient_df.to_dict("records"):
+        metrics = {name: patient[name] for name in ("bmi", "ideal_weight", "bmr", "tdee", "tbw")}
+        if not math.isnan(patient["tdee"]):
+            metrics["calorie_intake"] = calculate_calorie_intake(patient["tdee"], patient["goals"], patient["weight"], patient["ideal_weight"])
+        else:
+            metrics["calorie_intake"] = math.nan
+        # Metrics that cannot be calculated (gender other than Male or Female) are null
+        results.append({name: None if math.isnan(value) else value for name, value in metrics.items()})
+    return results
+
+
+# Function to generate the plans of a batch of requests, and the out-of-range nutrients of every day.
+# The batch is generated (and stored) together; when that fails, every request is generated on its own so only the
+# failing ones get their error.
+def generate_batch_plans(plan_requests):
+    try:
+        plans = generate_plans(plan_requests, app.state.catalog)
+    except Exception:
+        plans = []
+        for plan_request in plan_requests:
+            try:
+                plans.append(generate_plans([plan_request], app.state.catalog)[0])
+            except Exception as error:
+                plans.append(error)
+
+    results = []
+    for plan_request, plan in zip(plan_requests, plans):
+        if isinstance(plan, Exception):
+            results.append(plan)
+            continue
+        plan_id, multi_day_plan = plan
+        ranges = (plan_request["protein_range"], plan_request["carb_range"], plan_request["fat_range"])
+        results.append({
+            "plan_id": plan_id,
+            "plan": multi_day_plan,
+            "out_of_range": [out_of_range_nutrients(meal_plan, *ranges) for meal_plan in multi_day_plan],
+        })
+    return results
+
+
+submit_metrics = make_batcher(calculate_batch_metrics)
+submit_plan = make_batcher(generate_batch_plans)
+
+
+# Function to answer a request whose body is one item or a list of items, through a batcher
+async def answer_batched(request, read_item, submit):
+    try:
+        body = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "the body must be JSON"}, status_code=400)
+    items = body if isinstance(body, list) else [body]
+    try:
+        items = [read_item(item if isinstance(item, dict) else {}) for item in items]
+    except ValueError as error:
+        return JSONResponse({"error": str(error)}, status_code=400)
+    results = await asyncio.gather(*(submit(item) for item in items))
+    return JSONResponse(results if isinstance(body, list) else results[0])
+
+
+async def metrics_endpoint(request):
+    return await answer_batched(request, read_patient, submit_metrics)
+
+
+async def plan_endpoint(request):
+    return await answer_batched(request, read_plan_request, submit_plan)
+
+
+async def stored_plan_endpoint(request):
+    plan_id = request.path_params["plan_id"]
+    multi_day_plan = await asyncio.get_running_loop().run_in_executor(None, load_plan, plan_id)
+    if multi_day_plan is None:
+        return JSONResponse({"error": "no stored plan with this ID"}, status_code=404)
+    return JSONResponse({"plan_id": plan_id, "plan": multi_day_plan})
+
+
+# Stored plans (?plan_id=...&plan_id=...) exported as CSV, JSON Lines or printable HTML (?format=...), streamed one day
+# at a time
+async def export_endpoint(request):
+    plan_ids = request.query_params.getlist("plan_id")
+    export_format = request.query_params.get("format", "csv")
+    if not plan_ids:
+        return JSONResponse({"error": "give at least one plan_id"}, status_code=400)
+    if export_format not in EXPORT_FORMATS:
+        return JSONResponse({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}, status_code=400)
+    for plan_id in plan_ids:
+        if await asyncio.get_running_loop().run_in_executor(None, load_plan, plan_id) is None:
+            return JSONResponse({"error": f"no stored plan with the ID {plan_id}"}, status_code=404)
+    chunks = export_chunks(stored_plan_days((None, plan_id) for plan_id in plan_ids), export_format)
+    return StreamingResponse(
+        (chunk.encode("utf-8") for chunk in chunks), media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f"attachment; filename=plans.{export_format}"},
+    )
+
+
+# Timings of this worker process, in the Prometheus text format (or JSON with ?format=json)
+async def timings_endpoint(request):
+    if request.query_params.get("format") == "json":
+        return JSONResponse(timings_snapshot())
+    return PlainTextResponse(timings_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+# Load the catalog and build its indexes before the first request, once per worker process
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    meals_df = load_meal_catalog(app.state.catalog)
+    get_meal_index(meals_df)
+    get_meal_bitsets(meals_df)
+    load_ingredient_matrix(app.state.catalog)
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route("/metrics", metrics_endpoint, methods=["POST"]),
+        Route("/plan", plan_endpoint, methods=["POST"]),
+        Route("/plan/{plan_id}", stored_plan_endpoint, methods=["GET"]),
+        Route("/export", export_endpoint, methods=["GET"]),
+        Route("/timings", timings_endpoint, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
+app.state.catalog = CATALOG_FILE
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the metrics and meal plans over HTTP/JSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    args = parser.parse_args()
+    uvicorn.run("plan_api:app", host=args.host, port=args.port, workers=args.workers)
@@ -0,0 +1,175 @@
+import collections
+import datetime
+import hashlib
+import json
+import os
+import secrets
+import threading
+
+import numpy as np
+
+from meal_catalog import CATALOG_FILE, catalog_version, load_meal_catalog
+from meal_planner import generate_multi_day_plan
+from meal_solver import DEFAULT_MEAL_BUDGET, GREEDY_ENGINE
+from patient_store import DATABASE_FILE, get_connection
+from timings import count_event
+
+
+# Generated plans are stored in the patient database, next to the visits, so they can be printed again by plan ID
+CREATE_PLAN_TABLE = """
+CREATE TABLE IF NOT EXISTS meal_plans (
+    plan_id TEXT PRIMARY KEY,
+    plan_key TEXT,
+    seed INTEGER,
+    plan TEXT,
+    datetime TEXT
+)
+"""
+INSERT_PLAN = "INSERT OR IGNORE INTO meal_plans (plan_id, plan_key, seed, plan, datetime) VALUES (?, ?, ?, ?, ?)"
+
+# Most plans kept in memory by a process
+PLAN_CACHE_SIZE = 256
+
+# Options of a plan request and their defaults
+PLAN_OPTIONS = {
+    "days": 1,
+    "protein_range": None,
+    "carb_range": None,
+    "fat_range": None,
+    "engine": GREEDY_ENGINE,
+    "variety_days": 0,
+    "seed": None,
+    "include": None,
+    "exclude": None,
+}
+
+_plan_cache = collections.OrderedDict()
+_plan_cache_lock = threading.Lock()
+_plan_tables = set()
+
+
+# Function to derive a plan seed from some values, e.g. a patient name and a date, so the same values always give
+# the same plan
+def derive_seed(*parts):
+    digest = hashlib.sha1("\x1f".join(str(part) for part in parts).encode("utf-8")).digest()
+    # 63 bits, so the seed fits an SQLite INTEGER
+    return int.from_bytes(digest[:8], "big") >> 1
+
+
+# Function to draw a new random plan seed
+def new_seed():
+    return secrets.randbits(63)
+
+
+# Function to build the key of a plan: every input that decides its meals
+def plan_key(calorie_intake, days, protein_range, carb_range, fat_range, engine, variety_days, seed, version, include=None, exclude=None):
+    ranges = [[float(value) for value in value_range] if value_range else None for value_range in (protein_range, carb_range, fat_range)]
+    key = [version, float(calorie_intake), int(days), ranges, engine, int(variety_days), int(seed)]
+    # Constraints only join the key when given, so plans without them keep their IDs
+    constraints = [{column: sorted(values) for column, values in sorted((constraints or {}).items()) if values} for constraints in (include, exclude)]
+    if any(constraints):
+        key.append(constraints)
+    return json.dumps(key, ensure_ascii=False)
+
+
+# Function to get the plan ID of a plan key
+def plan_id_of(key):
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+# Function to get the connection of the plan database, creating the plan table on first use
+def _plan_connection(path):
+    connection = get_connection(path)
+    path = os.path.abspath(path)
+    if path not in _plan_tables:
+        with connection:
+            connection.execute(CREATE_PLAN_TABLE)
+        _plan_tables.add(path)
+    return connection
+
+
+# Function to keep a plan in the in-memory cache, dropping the least recently used one when it is full
+def _remember_plan(plan_id, multi_day_plan):
+    with _plan_cache_lock:
+        _plan_cache[plan_id] = multi_day_plan
+        _plan_cache.move_to_end(plan_id)
+        while len(_plan_cache) > PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+
+
+# Function to load a plan by its ID, from memory or from the database (with path None, from memory only).
+# Returns the plan (one meal plan per day), or None for an unknown plan ID.
+def load_plan(plan_id, path=DATABASE_FILE):
+    with _plan_cache_lock:
+        if plan_id in _plan_cache:
+            _plan_cache.move_to_end(plan_id)
+            return _plan_cache[plan_id]
+    if path is None:
+        return None
+
+    row = _plan_connection(path).execute("SELECT plan FROM meal_plans WHERE plan_id = ?", (plan_id,)).fetchone()
+    if row is None:
+        return None
+    multi_day_plan = json.loads(row[0])
+    _remember_plan(plan_id, multi_day_plan)
+    return multi_day_plan
+
+
+# Function to store generated plans, given as (plan ID, plan key, seed, plan) tuples, in one transaction
+def store_plans(plans, path=DATABASE_FILE):
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    rows = [(plan_id, key, seed, json.dumps(multi_day_plan, ensure_ascii=False), now) for plan_id, key, seed, multi_day_plan in plans]
+    connection = _plan_connection(path)
+    with connection:
+        connection.executemany(INSERT_PLAN, rows)
+
+
+# Function to get the plan of a seed: looked up by its plan ID when it was generated before, generated and stored
+# otherwise. Without a seed a new one is drawn. The knapsack engine runs with a meal budget instead of a time budget
+# here, so it stays bounded and a plan generated again from its inputs is always the same.
+# Returns the plan ID and the plan (one meal plan per day).
+def generate_plan(calorie_intake, days=1, protein_range=None, carb_range=None, fat_range=None, engine=GREEDY_ENGINE, variety_days=0, seed=None, catalog=CATALOG_FILE, path=DATABASE_FILE, store=True, include=None, exclude=None):
+    plan_request = {
+        "calorie_intake": calorie_intake, "days": days, "protein_range": protein_range, "carb_range": carb_range, "fat_range": fat_range,
+        "engine": engine, "variety_days": variety_days, "seed": seed, "include": include, "exclude": exclude,
+    }
+    return generate_plans([plan_request], catalog, path, store)[0]
+
+
+# Function to get the plans of a batch of requests, each a dict of generate_plan arguments (calorie_intake and any of
+# PLAN_OPTIONS). Requests for the same plan are generated once, and the new plans are stored in one transaction.
+# Returns a (plan ID, plan) pair per request.
+def generate_plans(plan_requests, catalog=CATALOG_FILE, path=DATABASE_FILE, store=True):
+    meals_df = load_meal_catalog(catalog)
+    version = catalog_version(catalog)
+    new_plans = {}
+    results = []
+    for plan_request in plan_requests:
+        options = dict(PLAN_OPTIONS, **plan_request)
+        seed = options["seed"] if options["seed"] is not None else new_seed()
+        key = plan_key(
+            options["calorie_intake"], options["days"], options["protein_range"], options["carb_range"], options["fat_range"],
+            options["engine"], options["variety_days"], seed, version, options["include"], options["exclude"]
+        )
+        plan_id = plan_id_of(key)
+
+        if plan_id in new_plans:
+            multi_day_plan = new_plans[plan_id][3]
+        else:
+            multi_day_plan = load_plan(plan_id, path if store else None)
+        if multi_day_plan is None:
+            count_event("plan cache miss")
+            multi_day_plan = generate_multi_day_plan(
+                options["calorie_intake"], meals_df, options["days"], options["protein_range"], options["carb_range"], options["fat_range"],
+                options["engine"], options["variety_days"], np.random.default_rng(seed), time_budget=None,
+                include=options["include"], exclude=options["exclude"], meal_budget=DEFAULT_MEAL_BUDGET
+            )
+            _remember_plan(plan_id, multi_day_plan)
+            new_plans[plan_id] = (plan_id, key, seed, multi_day_plan)
+        else:
+            count_event("plan cache hit")
+        results.append((plan_id, multi_day_plan))
+
+    if store and new_plans:
+        store_plans(new_plans.values(), path)
+    return results
@@ -0,0 +1,140 @@
+import argparse
+import csv
+import html
+import io
+import json
+import os
+import sys
+
+from plan_view import meal_plan_html
+
+
+# Export of meal plans as CSV, JSON Lines or printable HTML (print it to PDF from the browser).
+# The exports are written one day at a time from a generator of days, so a 90-day plan or the plans of a whole ward
+# never have to be held in memory at once:
+#   python plan_export.py plans.csv ward.html        (plans.csv written by plan_roster.py, one plan per patient)
+#   python plan_export.py --plan-id 1f2e3d4c5b6a7988 plan.jsonl
+
+EXPORT_FORMATS = ["csv", "jsonl", "html"]
+
+# Meal record fields exported for every meal, after the patient, plan ID, day and category
+EXPORT_FIELDS = ["Meal", "Calories", "Protein (g)", "Carbohydrates (g)", "Fat (g)", "Weight (g)", "Meal Type", "Ingredients"]
+
+# Media type of every export format
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "jsonl": "application/x-ndjson", "html": "text/html; charset=utf-8"}
+
+# Page header and footer of the HTML export; every day starts on a new printed page
+HTML_HEAD = (
+    "<!DOCTYPE html><html lang='ar'><head><meta charset='utf-8'><title>{title}</title><style>"
+    "body {{ font-family: tahoma, sans-serif; }} section {{ break-after: page; }} "
+    "h2 {{ text-align: center; font-size: 20px; background-color: #FFB6C1; padding: 6px; }} "
+    "@page {{ size: A4; margin: 12mm; }}"
+    "</style></head><body>"
+)
+HTML_FOOT = "</body></html>"
+
+
+# Function to get the days of a plan, one at a time, as the export functions take them
+def plan_days(plan_id, multi_day_plan, patient_name=None):
+    for day, meal_plan in enumerate(multi_day_plan, start=1):
+        yield {"patient_name": patient_name, "plan_id": plan_id, "day": day, "plan": meal_plan}
+
+
+# Function to get the days of stored plans, given as (patient name, plan ID) pairs. Each plan is loaded from the plan
+# store when its turn comes; a plan ID that is not stored raises a KeyError.
+def stored_plan_days(plans, path=None):
+    from plan_cache import DATABASE_FILE, load_plan
+
+    for patient_name, plan_id in plans:
+        multi_day_plan = load_plan(plan_id, path or DATABASE_FILE)
+        if multi_day_plan is None:
+            raise KeyError(plan_id)
+        yield from plan_days(plan_id, multi_day_plan, patient_name)
+
+
+# Function to get the (patient name, plan ID) pairs of a plans file written by plan_roster.py, reading it row by row.
+# The file has one row per planned meal, so a plan ID repeated on the next rows is only given once.
+def roster_plans(path):
+    with open(path, mode='r', encoding='utf-8-sig', newline='') as file:
+        previous = None
+        for row in csv.DictReader(file):
+            plan = (row.get("patient_name"), row["plan_id"])
+            if plan != previous:
+                yield plan
+                previous = plan
+
+
+# Function to get the export of a stream of days as text chunks, one per day (plus the header and footer of the
+# format), e.g. to write them to a file or stream them in an HTTP response
+def export_chunks(days, export_format, title="Meal plans"):
+    if export_format == "csv":
+        buffer = io.StringIO()
+        # With the byte order mark, spreadsheet programs open the Arabic text as UTF-8
+        buffer.write("\ufeff")
+        csv.writer(buffer).writerow(["patient_name", "plan_id", "day", "category"] + EXPORT_FIELDS)
+        yield buffer.getvalue()
+    elif export_format == "html":
+        yield HTML_HEAD.format(title=html.escape(title))
+    elif export_format != "jsonl":
+        raise ValueError(f"export format must be one of {', '.join(EXPORT_FORMATS)}")
+
+    for day in days:
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for category, meals in day["plan"].items():
+                for meal_info in meals:
+                    writer.writerow([day["patient_name"], day["plan_id"], day["day"], category] + [meal_info[field] for field in EXPORT_FIELDS])
+            yield buffer.getvalue()
+        elif export_format == "jsonl":
+            yield json.dumps(day, ensure_ascii=False) + "\n"
+        else:
+            heading = f"Day {day['day']}" if not day["patient_name"] else f"{day['patient_name']} - Day {day['day']}"
+            yield (
+                f"<section><h2>{html.escape(heading)}</h2><p>Plan ID: {html.escape(day['plan_id'])}</p>"
+                f"{meal_plan_html(day['plan'])}</section>"
+            )
+
+    if export_format == "html":
+        yield HTML_FOOT
+
+
+# Function to write the export of a stream of days to a file. It is written under a temporary name and only replaces
+# the file once complete, so an error partway (e.g. an unknown plan ID) leaves no truncated export behind.
+def write_export(days, path, export_format, title="Meal plans"):
+    try:
+        with open(path + ".tmp", mode='w', encoding='utf-8', newline='') as file:
+            for chunk in export_chunks(days, export_format, title):
+                file.write(chunk)
+    except BaseException:
+        os.remove(path + ".tmp")
+        raise
+    os.replace(path + ".tmp", path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export stored meal plans as CSV, JSON Lines or printable HTML, one day at a time.")
+    parser.add_argument("plans", nargs="?", help="plans file written by plan_roster.py (the plans of its plan_id column are exported)")
+    parser.add_argument("output", help="output file (.csv, .jsonl or .html)")
+    parser.add_argument("--plan-id", action="append", dest="plan_ids", help="plan ID to export (repeatable)")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, help="output format (default: from the output file extension)")
+    parser.add_argument("--database", help="database the plans are stored in")
+    parser.add_argument("--title", default="Meal plans", help="title of the HTML export")
+    args = parser.parse_args(argv)
+
+    export_format = args.format or os.path.splitext(args.output)[1].lstrip(".").lower()
+    if export_format not in EXPORT_FORMATS:
+        parser.error(f"cannot tell the output format of {args.output}, use --format")
+    if not args.plans and not args.plan_ids:
+        parser.error("give a plans file or --plan-id")
+
+    plans = roster_plans(args.plans) if args.plans else [(None, plan_id) for plan_id in args.plan_ids]
+    try:
+        write_export(stored_plan_days(plans, args.database), args.output, export_format, args.title)
+    except KeyError as error:
+        parser.error(f"no stored plan with the ID {error.args[0]}")
+    print(f"Exported to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
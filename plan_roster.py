@@ -0,0 +1,192 @@
+import argparse
+import datetime
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from body_metrics import calculate_calorie_intake
+from meal_catalog import CATALOG_FILE, load_meal_catalog
+from meal_filters import FILTER_COLUMNS
+from meal_ingredients import shopping_list
+from meal_selection import CATALOG_ROW_KEY
+from meal_solver import ENGINES, GREEDY_ENGINE
+from patient_metrics import calculate_patient_metrics
+from patient_store import DATABASE_FILE
+from plan_cache import derive_seed, generate_plan
+
+
+# Output formats of the plan file, picked from the file extension when not given
+OUTPUT_FORMATS = ["csv", "json", "parquet"]
+
+# Meal record fields written for every planned meal
+PLAN_FIELDS = ["Meal", "Calories", "Protein (g)", "Carbohydrates (g)", "Fat (g)", "Weight (g)", "Meal Type", "Ingredients"]
+
+# Columns of the plans table, one row per planned meal
+PLAN_COLUMNS = ["patient_name", "datetime", "plan_id", "bmr", "tdee", "calorie_intake", "day", "category"] + PLAN_FIELDS + [CATALOG_ROW_KEY]
+
+
+# Function to plan the meals of one roster row, with the bmr, tdee and ideal_weight columns already calculated.
+# The plan is stored in the plan cache, so its plan ID can be printed again from the patient page.
+# Returns one flat record per planned meal, or no records when the metrics cannot be calculated (e.g. gender "Other").
+def plan_patient(patient, options, seed):
+    goals = patient.get("goals")
+    goals = goals.split(";") if isinstance(goals, str) and goals else list(options["goals"])
+
+    bmr = patient["bmr"]
+    tdee = patient["tdee"]
+    if np.isnan(bmr) or np.isnan(tdee):
+        return []
+    calorie_intake = calculate_calorie_intake(tdee, goals, patient["weight"], patient["ideal_weight"])
+
+    plan_id, multi_day_plan = generate_plan(
+        calorie_intake, options["days"], options["protein_range"], options["carb_range"], options["fat_range"],
+        options["engine"], options["variety_days"], seed, options["catalog"], options["database"],
+        include=options["include"], exclude=options["exclude"]
+    )
+
+    records = []
+    for day, meal_plan in enumerate(multi_day_plan, start=1):
+        for category, meals in meal_plan.items():
+            for meal_info in meals:
+                record = {
+                    "patient_name": patient.get("patient_name"),
+                    "datetime": patient.get("datetime"),
+                    "plan_id": plan_id,
+                    "bmr": bmr,
+                    "tdee": tdee,
+                    "calorie_intake": calorie_intake,
+                    "day": day,
+                    "category": category,
+                }
+                record.update({field: meal_info[field] for field in PLAN_FIELDS})
+                # Plans stored before meal records kept their catalog row have none
+                record[CATALOG_ROW_KEY] = meal_info.get(CATALOG_ROW_KEY)
+                records.append(record)
+    return records
+
+
+# Function to get the plan seed of a roster row. Without --seed it comes from the patient name and the visit date,
+# the seed the patient pages use for that patient on that day before a new plan round is started.
+def patient_seed(row_number, patient, options):
+    if options["seed"] is not None:
+        return derive_seed(options["seed"], row_number)
+    visit_date = patient.get("datetime")
+    visit_date = visit_date[:10] if isinstance(visit_date, str) else datetime.date.today().isoformat()
+    return derive_seed(patient.get("patient_name"), visit_date, 0)
+
+
+# Function run in the worker processes: plans a chunk of (row number, roster row) pairs
+def plan_chunk(chunk, options):
+    records = []
+    for row_number, patient in chunk:
+        records.extend(plan_patient(patient, options, patient_seed(row_number, patient, options)))
+    return records
+
+
+# Function to plan the meals of every roster row across a pool of worker processes
+def plan_roster(roster_df, options, workers=None):
+    workers = workers or os.cpu_count() or 1
+
+    # Calculate the metrics of the whole roster in one pass before splitting it between the workers
+    activity_level = options["activity_level"]
+    if "activity_level" in roster_df.columns:
+        roster_df = roster_df.assign(activity_level=roster_df["activity_level"].fillna(activity_level))
+        activity_level = "activity_level"
+    roster_df = calculate_patient_metrics(roster_df, activity_level)
+
+    patients = list(enumerate(roster_df.to_dict("records")))
+    # The columns are given, so a roster whose rows cannot be planned (e.g. all gender "Other") gives an empty table
+    if workers == 1 or not patients:
+        return pd.DataFrame(plan_chunk(patients, options), columns=PLAN_COLUMNS)
+
+    # A few chunks per worker keeps the pool busy without sending every row as its own task
+    chunk_count = min(len(patients), workers * 4)
+    chunk_size = -(-len(patients) // chunk_count)
+    chunks = [patients[start:start + chunk_size] for start in range(0, len(patients), chunk_size)]
+    records = []
+    # Every worker parses the catalog once, then plans all of its chunks from the cached copy
+    with ProcessPoolExecutor(max_workers=workers, initializer=load_meal_catalog, initargs=(options["catalog"],)) as executor:
+        for chunk_records in executor.map(plan_chunk, chunks, [options] * len(chunks)):
+            records.extend(chunk_records)
+    return pd.DataFrame(records, columns=PLAN_COLUMNS)
+
+
+# Function to turn COLUMN=VALUE arguments into a {column: [values]} constraint dict
+def parse_constraints(parser, arguments):
+    constraints = {}
+    for argument in arguments or []:
+        column, separator, value = argument.partition("=")
+        if not separator or column not in FILTER_COLUMNS:
+            parser.error(f"constraints are COLUMN=VALUE with COLUMN one of {', '.join(FILTER_COLUMNS)}: {argument}")
+        constraints.setdefault(column, []).append(value)
+    return constraints
+
+
+# Function to write the plans in the given format
+def write_plans(plans_df, path, output_format):
+    if output_format == "csv":
+        plans_df.to_csv(path, index=False, encoding='utf-8-sig')
+    elif output_format == "json":
+        plans_df.to_json(path, orient="records", force_ascii=False, indent=2)
+    else:
+        plans_df.to_parquet(path, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate meal plans for every patient of a roster (patient_data.csv schema).")
+    parser.add_argument("roster", help="patient roster CSV file")
+    parser.add_argument("output", help="output file (.csv, .json or .parquet)")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, help="output format (default: from the output file extension)")
+    parser.add_argument("--catalog", default=CATALOG_FILE, help="meal catalog CSV file")
+    parser.add_argument("--database", default=DATABASE_FILE, help="database the plans are stored in, by plan ID")
+    parser.add_argument("--shopping-list", help="also write the ingredient totals of all the plans to this CSV file")
+    parser.add_argument("--days", type=int, default=1, help="number of days to plan for each patient")
+    parser.add_argument("--engine", choices=ENGINES, default=GREEDY_ENGINE)
+    parser.add_argument("--variety-days", type=int, default=0, help="days before a meal can be repeated")
+    parser.add_argument("--activity-level", default="Sedentary", help="activity level for rows without an activity_level column")
+    parser.add_argument("--goal", action="append", dest="goals", help="weight goal for rows without a goals column (repeatable)")
+    parser.add_argument("--protein-range", type=float, nargs=2, metavar=("MIN", "MAX"))
+    parser.add_argument("--carb-range", type=float, nargs=2, metavar=("MIN", "MAX"))
+    parser.add_argument("--fat-range", type=float, nargs=2, metavar=("MIN", "MAX"))
+    parser.add_argument("--include", action="append", metavar="COLUMN=VALUE", help="only plan meals with this value (repeatable, e.g. \"Meal Category=Main Course\")")
+    parser.add_argument("--exclude", action="append", metavar="COLUMN=VALUE", help="never plan meals with this value (repeatable, e.g. Ingredients=سكر)")
+    parser.add_argument("--latest", action="store_true", help="only plan the most recent visit of each patient")
+    parser.add_argument("--seed", type=int, help="seed of the plans (default: from the patient name and the visit date)")
+    parser.add_argument("--workers", type=int, help="number of worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    output_format = args.format or os.path.splitext(args.output)[1].lstrip(".").lower()
+    if output_format not in OUTPUT_FORMATS:
+        parser.error(f"cannot tell the output format of {args.output}, use --format")
+
+    roster_df = pd.read_csv(args.roster)
+    if args.latest and "datetime" in roster_df.columns:
+        roster_df = roster_df.sort_values("datetime", kind="stable").drop_duplicates("patient_name", keep="last")
+
+    options = {
+        "catalog": os.path.abspath(args.catalog),
+        "database": os.path.abspath(args.database),
+        "days": args.days,
+        "engine": args.engine,
+        "variety_days": args.variety_days,
+        "activity_level": args.activity_level,
+        "goals": args.goals or ["Maintenance"],
+        "protein_range": args.protein_range,
+        "carb_range": args.carb_range,
+        "fat_range": args.fat_range,
+        "seed": args.seed,
+        "include": parse_constraints(parser, args.include),
+        "exclude": parse_constraints(parser, args.exclude),
+    }
+    plans_df = plan_roster(roster_df, options, args.workers)
+    write_plans(plans_df, args.output, output_format)
+    if args.shopping_list:
+        shopping_list(plans_df[[CATALOG_ROW_KEY, "Ingredients"]].to_dict("records"), args.catalog).to_csv(args.shopping_list, index=False, encoding='utf-8-sig')
+    print(f"Planned {plans_df['patient_name'].nunique()} patients ({len(roster_df)} roster rows) into {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
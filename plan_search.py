@@ -0,0 +1,101 @@
+import atexit
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+import time
+
+from meal_catalog import CATALOG_FILE, load_meal_catalog
+from meal_planner import score_plan
+from patient_store import DATABASE_FILE
+from plan_cache import PLAN_OPTIONS, derive_seed, generate_plans, new_seed
+from timings import count_event, timed
+
+
+# Best-of-N plan generation: many seeded candidate plans are generated across a pool of worker processes, scored on
+# calorie error and macro range violation (meal_planner.score_plan), and the best one is kept. Plans are seeded, so
+# the workers only send back scores and the best plan is generated again (and stored) in the calling process.
+
+# Default number of candidates and wall-clock budget (seconds) of a search
+DEFAULT_CANDIDATES = 32
+DEFAULT_SEARCH_BUDGET = 2.0
+
+# Candidates scored per task sent to a worker, and the most worker processes of the pool
+CANDIDATES_PER_TASK = 4
+MAX_SEARCH_WORKERS = 8
+
+# One pool per process, started on first use and kept for the next searches
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Function to get the worker pool; every worker loads the catalog once when it starts.
+# The calling process is often a threaded server (Streamlit, the plan API), so the workers are started from a fork
+# server (or spawned, where there is none) instead of forking it with its locks held by other threads.
+def get_search_pool(catalog=CATALOG_FILE):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=min(os.cpu_count() or 1, MAX_SEARCH_WORKERS), mp_context=multiprocessing.get_context(start_method),
+                initializer=load_meal_catalog, initargs=(catalog,)
+            )
+            atexit.register(shutdown_search_pool)
+        return _pool
+
+
+# Function to stop the worker pool, dropping the searches still queued; the next search starts a new one
+def shutdown_search_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+# Function run in the workers: scores the candidates of some seeds, until the deadline (a time.time() value) passes.
+# Returns (score, seed) pairs.
+def score_candidates(plan_request, seeds, catalog, deadline):
+    scores = []
+    for seed in seeds:
+        if scores and time.time() > deadline:
+            break
+        candidate = dict(plan_request, seed=seed)
+        plan_id, multi_day_plan = generate_plans([candidate], catalog, store=False)[0]
+        ranges = (candidate["protein_range"], candidate["carb_range"], candidate["fat_range"])
+        scores.append((score_plan(multi_day_plan, candidate["calorie_intake"], *ranges), seed))
+    return scores
+
+
+# Function to find the best of `candidates` seeded plans for a plan request (a dict of plan_cache.generate_plan
+# arguments), within `time_budget` seconds. The candidate seeds come from the request seed, but the candidates scored
+# before the budget runs out can differ from run to run; the returned plan ID always prints the same plan again.
+# Returns the plan ID, the plan and its score.
+@timed("best-of-n plan search")
+def search_best_plan(plan_request, candidates=DEFAULT_CANDIDATES, time_budget=DEFAULT_SEARCH_BUDGET, catalog=CATALOG_FILE, path=DATABASE_FILE, parallel=True):
+    plan_request = dict(PLAN_OPTIONS, **plan_request)
+    base_seed = plan_request["seed"] if plan_request["seed"] is not None else new_seed()
+    seeds = [derive_seed(base_seed, candidate) for candidate in range(candidates)]
+    deadline = time.time() + time_budget
+
+    scores = []
+    if parallel and candidates > 1:
+        pool = get_search_pool(catalog)
+        futures = [
+            pool.submit(score_candidates, plan_request, seeds[start:start + CANDIDATES_PER_TASK], catalog, deadline)
+            for start in range(0, candidates, CANDIDATES_PER_TASK)
+        ]
+        done, not_done = concurrent.futures.wait(futures, timeout=max(0.0, deadline - time.time()))
+        for future in not_done:
+            future.cancel()
+        for future in done:
+            scores.extend(future.result())
+        count_event("best-of-n candidates", len(scores))
+    if not scores:
+        # No worker finished in time (or no pool): score the first candidate here, so there is always a plan
+        scores = score_candidates(plan_request, seeds[:1] if parallel else seeds, catalog, deadline)
+
+    best_score, best_seed = min(scores)
+    plan_id, multi_day_plan = generate_plans([dict(plan_request, seed=best_seed)], catalog, path)[0]
+    return plan_id, multi_day_plan, best_score
@@ -0,0 +1,51 @@
+import html
+
+import streamlit as st
+
+from timings import timed
+
+
+# Columns of the meal table of a day, as (meal record field, column title)
+MEAL_TABLE_COLUMNS = [
+    ("Meal", "الوجبة"),
+    ("Calories", "Calories (kcal)"),
+    ("Protein (g)", "البروتين (جرام)"),
+    ("Carbohydrates (g)", "الكربوهيدرات (جرام)"),
+    ("Fat (g)", "الدهون (جرام)"),
+    ("Weight (g)", "وزن الوجبة (جرام)"),
+    ("Meal Type", "Meal type"),
+    ("Ingredients", "مكونات الوجبة (gm)"),
+    ("Category", "نوع الوجبة"),
+]
+
+
+# Function to build the HTML of a day meal plan: one table per meal category and the day total
+@timed("plan rendering")
+def meal_plan_html(meal_plan):
+    header = "".join(f"<th style='padding: 4px;'>{html.escape(title)}</th>" for field, title in MEAL_TABLE_COLUMNS)
+    parts = []
+    total_calories = 0
+    for category, meals in meal_plan.items():
+        parts.append(f"<h1 style='text-align: center; font-size: 22px;background-color: lightgreen; padding: 10px;'>{html.escape(category)}</h1>")
+        rows = []
+        for meal_info in meals:
+            cells = "".join(f"<td style='padding: 4px;'>{html.escape(str(meal_info[field]))}</td>" for field, title in MEAL_TABLE_COLUMNS)
+            rows.append(f"<tr>{cells}</tr>")
+            total_calories += meal_info['Calories']
+        parts.append(f"<table dir='rtl' style='width: 100%; font-size: 14px;'><tr style='background-color: lightgray;'>{header}</tr>{''.join(rows)}</table>")
+    parts.append(f"<p style='background-color: #E8F0FE; padding: 10px;'>Total Calories of day meals : <b>{total_calories}</b> kcal</p>")
+    return "".join(parts)
+
+
+# Function to display a day meal plan as a single element
+def display_day_table(meal_plan):
+    st.markdown(meal_plan_html(meal_plan), unsafe_allow_html=True)
+
+
+# Function to let the user pick one day of a multi-day plan; only the picked day is then displayed.
+# Days past the given day names are named "Day <number>".
+# Returns the name and the meal plan of the picked day.
+def select_plan_day(multi_day_plan, day_names, key):
+    labels = [day_names[day] if day < len(day_names) else f"Day {day + 1}" for day in range(len(multi_day_plan))]
+    day = st.radio("Day", options=range(len(multi_day_plan)), format_func=labels.__getitem__, horizontal=True, key=key)
+    return labels[day], multi_day_plan[day]
@@ -0,0 +1,29 @@
+import collections
+
+import streamlit as st
+
+
+# Most results kept per memo in a session; the least recently used one is dropped first
+MEMO_SIZE = 16
+
+
+# Function to get the result of `function(*args)` from a memo kept in the session state.
+# `key` is the tuple of every input the result depends on; the function is only called for a key not seen in the
+# last MEMO_SIZE calls of this session, so a rerun with unchanged inputs reuses the previous result.
+def memoize(name, key, function, *args, size=MEMO_SIZE):
+    memo = st.session_state.setdefault("memo_" + name, collections.OrderedDict())
+    if key in memo:
+        memo.move_to_end(key)
+        return memo[key]
+    result = memo[key] = function(*args)
+    while len(memo) > size:
+        memo.popitem(last=False)
+    return result
+
+
+# Function to get the number of the current plan round of the session. The plans of a round are reused on every
+# rerun; starting a new round (e.g. with a "Regenerate" button) gives new plans for the same inputs.
+def plan_round(new=False):
+    if new:
+        st.session_state["plan_round"] = st.session_state.get("plan_round", 0) + 1
+    return st.session_state.get("plan_round", 0)
@@ -0,0 +1,119 @@
+import bisect
+import contextlib
+import functools
+import os
+import threading
+import time
+
+
+# Timers and counters of the hot paths (catalog load, filtering, selection, rendering, patient I/O).
+# They only record when enabled, with AIMEAL_TIMINGS=1 in the environment or enable_timings(); when disabled a timed
+# function costs one flag check and a timer block enters a shared no-op context.
+
+# Upper bounds (seconds) of the timing histogram buckets
+TIMING_BUCKETS = [0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0]
+
+_enabled = os.environ.get("AIMEAL_TIMINGS", "") not in ("", "0")
+_timings = {}
+_counters = {}
+_lock = threading.Lock()
+_no_timer = contextlib.nullcontext()
+
+
+# Function to turn the timers and counters on or off for this process
+def enable_timings(enabled=True):
+    global _enabled
+    _enabled = enabled
+
+
+def timings_enabled():
+    return _enabled
+
+
+# Function to record one timing
+def record_timing(name, seconds):
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = {"count": 0, "total": 0.0, "max": 0.0, "buckets": [0] * (len(TIMING_BUCKETS) + 1)}
+        timing["count"] += 1
+        timing["total"] += seconds
+        timing["max"] = max(timing["max"], seconds)
+        timing["buckets"][bisect.bisect_left(TIMING_BUCKETS, seconds)] += 1
+
+
+# Function to add to a counter (e.g. cache hits)
+def count_event(name, value=1):
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + value
+
+
+@contextlib.contextmanager
+def _timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start)
+
+
+# Function to time a block: with timer("name"): ...
+def timer(name):
+    return _timer(name) if _enabled else _no_timer
+
+
+# Decorator to time every call of a function under the given name
+def timed(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record_timing(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+# Function to forget every recorded timing and counter
+def reset_timings():
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+
+
+# Function to get a JSON-ready copy of the timings (count, total, mean and max seconds) and counters
+def timings_snapshot():
+    with _lock:
+        timings = {
+            name: {"count": timing["count"], "total": timing["total"], "mean": timing["total"] / timing["count"], "max": timing["max"]}
+            for name, timing in _timings.items()
+        }
+        return {"enabled": _enabled, "timings": timings, "counters": dict(_counters)}
+
+
+# Function to get the timings and counters in the Prometheus text format
+def timings_prometheus():
+    lines = [
+        "# HELP aimeal_timing_seconds Time spent in the hot paths.",
+        "# TYPE aimeal_timing_seconds histogram",
+    ]
+    with _lock:
+        for name, timing in sorted(_timings.items()):
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            cumulative = 0
+            for bound, bucket_count in zip(TIMING_BUCKETS + ["+Inf"], timing["buckets"]):
+                cumulative += bucket_count
+                lines.append(f'aimeal_timing_seconds_bucket{{name="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'aimeal_timing_seconds_sum{{name="{label}"}} {timing["total"]}')
+            lines.append(f'aimeal_timing_seconds_count{{name="{label}"}} {timing["count"]}')
+        lines.append("# HELP aimeal_events_total Counted events, e.g. cache hits.")
+        lines.append("# TYPE aimeal_events_total counter")
+        for name, value in sorted(_counters.items()):
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            lines.append(f'aimeal_events_total{{name="{label}"}} {value}')
+    return "\n".join(lines) + "\n"